@@ -3,18 +3,22 @@ import { LineChart, Line, XAxis, YAxis, CartesianGrid, Tooltip, Legend, Responsi
 
 const API_URL='http://chivero:5000'
 
+// Server side bucket size for each period so a chart is at most a few thousand points
+const BUCKETS = { 3600: '1m', 86400: '5m', 604800: '5m' };
+
 function App() {
   const [data, setData] = useState([]);
   const [startTimestamp, setStartTimestamp] = useState(Math.floor(Date.now() / 1000 - 3600));
   const [period, setPeriod] = useState(3600); // Default: 1 hour in seconds
 
   useEffect(() => {
-    fetch(API_URL+`/read?start_timestamp=${startTimestamp}&period=${period}`, { mode: "cors" })
+    const bucket = BUCKETS[period] || '1h';
+    fetch(API_URL+`/aggregate?start_timestamp=${startTimestamp}&period=${period}&bucket=${bucket}&unit=C`, { mode: "cors" })
       .then(response => response.json())
       .then(jsonData => {
-        const formattedData = jsonData.readings.filter(item => item.unit==="C").map(item => ({
-          time: new Date(item.recorded_timestamp * 1000).toLocaleString(),
-          temperature: item.value
+        const formattedData = jsonData.aggregates.map(item => ({
+          time: new Date(item.bucket_start * 1000).toLocaleString(),
+          temperature: item.mean
         }));
         setData(formattedData);
       })
@@ -0,0 +1,313 @@
+"""
+Micro-benchmarks for the back-end.
+
+Each benchmark runs against a throwaway database in a temporary
+directory so it can be run anywhere without touching monitor.db.
+
+  python benchmark.py ingest --readings 20000
+  python benchmark.py logging 2>/dev/null
+  python benchmark.py sqlite --batches 500
+  python benchmark.py mixed --readers 48 2>/dev/null
+  python benchmark.py workers --max-workers 4
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlmodel import Session, SQLModel, create_engine
+
+import database
+import logger
+from sensor_reading import SensorReading, SensorReadingPayload
+
+
+def make_payloads(count: int, sensors: int = 5, start: int = 1_700_000_000):
+    """A backlog of readings such as a probe replays after an outage."""
+    return [
+        SensorReadingPayload(
+            sensor=f"probe_{i % sensors}",
+            unit="C",
+            value=15.0 + (i % 100) / 10.0,
+            recorded_timestamp=start + (i // sensors) * 300,
+        )
+        for i in range(count)
+    ]
+
+
+def temporary_engine(directory: str, name: str):
+    engine = create_engine(f"sqlite:///{os.path.join(directory, name)}")
+    SQLModel.metadata.create_all(engine)
+    return engine
+
+
+def ingest_orm(engine, payloads):
+    """The original /sense path: one ORM object per reading."""
+    with Session(engine) as session:
+        for p in payloads:
+            session.add(SensorReading.from_payload(p))
+        session.commit()
+
+
+def ingest_bulk(engine, payloads):
+    """The bulk /sense path: one multi-row INSERT per batch."""
+    with Session(engine) as session:
+        SensorReading.ingest(session, payloads)
+        session.commit()
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def bench_ingest(args):
+    payloads = make_payloads(args.readings)
+    with tempfile.TemporaryDirectory() as directory:
+        orm = timed(ingest_orm, temporary_engine(directory, "orm.db"), payloads)
+        bulk_engine = temporary_engine(directory, "bulk.db")
+        bulk = timed(ingest_bulk, bulk_engine, payloads)
+        replay = timed(ingest_bulk, bulk_engine, payloads)
+
+    print(f"readings:        {args.readings}")
+    print(f"orm per-row:     {args.readings / orm:12.0f} readings/s")
+    print(f"bulk insert:     {args.readings / bulk:12.0f} readings/s")
+    print(f"bulk replay:     {args.readings / replay:12.0f} readings/s (all duplicates)")
+    print(f"speedup:         {orm / bulk:12.1f}x")
+
+
+def bench_logging(args):
+    """
+    What each request pays for logging: the middleware's logger and
+    correlator, a /sense debug line and an info line.
+    """
+    readings = make_payloads(100)
+    request_logger = None
+    start = time.perf_counter()
+    for _ in range(args.requests):
+        correlator = logger.generate_correlation_id()
+        token = logger.correlator_var.set(correlator)
+        request_logger = logger.RequestLogger(correlator)
+        request_logger.debug("/sense readings=%r", readings)
+        request_logger.info("/sense ok")
+        logger.correlator_var.reset(token)
+    elapsed = time.perf_counter() - start
+
+    level = "DEBUG" if request_logger.is_debug() else "INFO"
+    print(f"log level:       {level}")
+    print(f"per request:     {elapsed / args.requests * 1e6:12.1f} us")
+    logger.shutdown()
+
+
+def bench_sqlite(args):
+    """
+    Each database profile on what the server does all day: /sense
+    commits of a few readings at a time, and /read queries from several
+    threads at once.
+    """
+    payloads = make_payloads(args.batches * args.batch_size)
+    batches = [payloads[i : i + args.batch_size] for i in range(0, len(payloads), args.batch_size)]
+
+    print(f"commits of {args.batch_size} readings, {args.batches} commits; {args.queries} /read queries")
+    for profile in database.PROFILES:
+        with tempfile.TemporaryDirectory() as directory:
+            engine = database.create_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}", profile)
+            SQLModel.metadata.create_all(engine)
+
+            def commits():
+                for batch in batches:
+                    ingest_bulk(engine, batch)
+
+            def query(i):
+                with Session(engine) as session:
+                    SensorReading.fetch_readings(session, start_timestamp=window, period=600, limit=100)
+
+            def queries():
+                with ThreadPoolExecutor(args.threads) as pool:
+                    list(pool.map(query, range(args.queries)))
+
+            window = int(time.time())
+            ingest = timed(commits)
+            read = timed(queries)
+            engine.dispose()
+        print(f"{profile + ':':16} {len(payloads) / ingest:10.0f} readings/s {args.queries / read:10.0f} queries/s")
+
+
+def percentile(latencies: list[float], p: float) -> float:
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def bench_mixed(args):
+    """
+    /sense latency while /read is busy: a week of readings is loaded
+    and then readers keep asking for the whole week downsampled while
+    probes post a few readings at a time.
+    """
+    import httpx
+    import main
+
+    week = 7 * 86400
+    now = int(time.time())
+    with tempfile.TemporaryDirectory() as directory:
+        engine = database.create_engine(f"sqlite:///{os.path.join(directory, 'mixed.db')}")
+        SQLModel.metadata.create_all(engine)
+        payloads = make_payloads(args.readings, start=now - week)
+        with Session(engine) as session:
+            for i in range(0, len(payloads), 5000):
+                SensorReading.ingest(session, payloads[i : i + 5000], now - week + i * week // len(payloads))
+            session.commit()
+        main.app.state.engine = engine
+
+        async def run():
+            sense, read = [], []
+            stop = time.monotonic() + args.seconds
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+                async def reader():
+                    while time.monotonic() < stop:
+                        start = time.perf_counter()
+                        await client.get("/read", params={"period": week, "max_points": 200})
+                        read.append(time.perf_counter() - start)
+
+                async def writer(probe):
+                    recorded = now
+                    while time.monotonic() < stop:
+                        batch = [
+                            {"sensor": f"bench_{probe}", "unit": "C", "value": 20.0, "recorded_timestamp": recorded + i}
+                            for i in range(5)
+                        ]
+                        recorded += 5
+                        start = time.perf_counter()
+                        r = await client.post("/sense", json=batch)
+                        sense.append(time.perf_counter() - start)
+                        assert r.status_code == 200
+                        await asyncio.sleep(0.01)
+
+                await asyncio.gather(*[reader() for _ in range(args.readers)], *[writer(i) for i in range(args.writers)])
+            return sense, read
+
+        sense, read = asyncio.run(run())
+        engine.dispose()
+
+    print(f"readers {args.readers}, writers {args.writers}, {args.seconds}s, {args.readings} readings stored")
+    for name, latencies in [("/sense", sense), ("/read", read)]:
+        print(
+            f"{name + ':':8} {len(latencies):6} requests"
+            f"  p50 {percentile(latencies, 50) * 1000:8.1f} ms"
+            f"  p95 {percentile(latencies, 95) * 1000:8.1f} ms"
+            f"  p99 {percentile(latencies, 99) * 1000:8.1f} ms"
+        )
+
+
+def bench_workers(args):
+    """
+    /sense throughput of startup.py with 1, 2, ... max_workers worker
+    processes. Each request is a batch of readings so the time goes on
+    parsing and validating json, which more workers can share out.
+    """
+    import httpx
+
+    here = os.path.dirname(os.path.abspath(__file__))
+
+    async def load(url):
+        latencies = []
+        stop = time.monotonic() + args.seconds
+        async with httpx.AsyncClient(base_url=url, timeout=30) as client:
+
+            async def probe(n):
+                recorded = int(time.time()) - 10_000_000
+                while time.monotonic() < stop:
+                    batch = [
+                        {"sensor": f"probe_{n}", "unit": "C", "value": 20.0, "recorded_timestamp": recorded + i}
+                        for i in range(args.batch)
+                    ]
+                    recorded += args.batch
+                    start = time.perf_counter()
+                    r = await client.post("/sense", json=batch)
+                    latencies.append(time.perf_counter() - start)
+                    assert r.status_code == 200
+
+            await asyncio.gather(*[probe(n) for n in range(args.clients)])
+        return latencies
+
+    print(f"{args.clients} clients posting {args.batch} readings per request for {args.seconds}s")
+    for workers in range(1, args.max_workers + 1):
+        with tempfile.TemporaryDirectory() as directory:
+            url = f"sqlite:///{os.path.join(directory, 'workers.db')}"
+            database.make_database(url)
+            env = {**os.environ, "TMONITOR_DB_URL": url, "TMONITOR_LOG_LEVEL": "WARNING"}
+            server = subprocess.Popen(
+                [sys.executable, "startup.py", "--workers", str(workers), "--host", "127.0.0.1", "--port", str(args.port)],
+                cwd=here,
+                env=env,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            try:
+                base = f"http://127.0.0.1:{args.port}"
+                for _ in range(100):
+                    try:
+                        httpx.get(base + "/stats")
+                        break
+                    except httpx.TransportError:
+                        time.sleep(0.1)
+                latencies = asyncio.run(load(base))
+            finally:
+                server.terminate()
+                server.wait()
+        print(
+            f"workers {workers}: {len(latencies) / args.seconds:8.1f} requests/s"
+            f" {len(latencies) * args.batch / args.seconds:10.0f} readings/s"
+            f"  p99 {percentile(latencies, 99) * 1000:8.1f} ms"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark parts of the back-end.")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    ingest = subparsers.add_parser("ingest", help="bulk /sense ingest against per-row ORM adds")
+    ingest.add_argument("--readings", type=int, default=20000)
+    ingest.set_defaults(function=bench_ingest)
+
+    logging = subparsers.add_parser("logging", help="per-request logging overhead")
+    logging.add_argument("--requests", type=int, default=5000)
+    logging.set_defaults(function=bench_logging)
+
+    sqlite = subparsers.add_parser("sqlite", help="database profiles on small commits and concurrent reads")
+    sqlite.add_argument("--batches", type=int, default=500)
+    sqlite.add_argument("--batch-size", type=int, default=5)
+    sqlite.add_argument("--queries", type=int, default=2000)
+    sqlite.add_argument("--threads", type=int, default=8)
+    sqlite.set_defaults(function=bench_sqlite)
+
+    mixed = subparsers.add_parser("mixed", help="/sense latency under concurrent /read load")
+    mixed.add_argument("--readings", type=int, default=50000)
+    mixed.add_argument("--readers", type=int, default=48)
+    mixed.add_argument("--writers", type=int, default=4)
+    mixed.add_argument("--seconds", type=float, default=20)
+    mixed.set_defaults(function=bench_mixed)
+
+    workers = subparsers.add_parser("workers", help="/sense throughput with 1 to N worker processes")
+    workers.add_argument("--max-workers", type=int, default=4)
+    workers.add_argument("--clients", type=int, default=16)
+    workers.add_argument("--batch", type=int, default=50)
+    workers.add_argument("--seconds", type=float, default=10)
+    workers.add_argument("--port", type=int, default=5099)
+    workers.set_defaults(function=bench_workers)
+
+    args = parser.parse_args()
+    args.function(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Compact columnar encoding of sensor readings.
+
+Most of a json /read response is the key names repeated for every
+reading. This encoding stores each column as a packed array instead,
+with the sensor and unit strings sent once in a dictionary. It is
+requested with "Accept: application/vnd.tmonitor.columnar" (or
+format=columnar) on /read.
+
+Layout, all little-endian. Every section starts on an 8 byte boundary
+so each column can be used in place, e.g. new Float64Array(buffer,
+offset, count) in a browser or numpy.frombuffer(..., offset=...).
+
+  header, 24 bytes:
+    magic              4 bytes   b"TMCR"
+    version            uint32    1
+    count              uint32    number of readings
+    strings            uint32    number of strings in the dictionary
+    strings_length     uint32    bytes in the dictionary
+    reserved           uint32    0
+  dictionary           strings_length bytes of utf-8, each string
+                       ended by a NUL byte, then padding
+  value                float64[count]
+  recorded_timestamp   uint32[count]  seconds since the epoch
+  received_timestamp   uint32[count]  seconds since the epoch
+  sensor               uint16[count]  index into the dictionary
+  unit                 uint16[count]  index into the dictionary
+
+Copyright (c) 2025 Timothy Norman Murphy <tnmurphy@gmail.com>
+
+See the LICENSE file in the current directory
+"""
+
+from array import array
+import struct
+import sys
+
+MEDIA_TYPE = "application/vnd.tmonitor.columnar"
+MAGIC = b"TMCR"
+VERSION = 1
+HEADER = struct.Struct("<4sIIIII")
+
+# (name, array typecode) in the order the columns are stored
+COLUMNS = (
+    ("value", "d"),
+    ("recorded_timestamp", "I"),
+    ("received_timestamp", "I"),
+    ("sensor", "H"),
+    ("unit", "H"),
+)
+
+
+def _padding(length: int) -> bytes:
+    return b"\0" * (-length % 8)
+
+
+def encode(rows) -> bytes:
+    """
+    rows are (sensor, unit, value, recorded_timestamp, received_timestamp)
+    tuples, e.g. from SensorReading.stream_readings
+    """
+    strings = {}
+    columns = {name: array(typecode) for name, typecode in COLUMNS}
+    value = columns["value"].append
+    recorded = columns["recorded_timestamp"].append
+    received = columns["received_timestamp"].append
+    sensor_index = columns["sensor"].append
+    unit_index = columns["unit"].append
+
+    for sensor, unit, v, recorded_timestamp, received_timestamp in rows:
+        s = strings.get(sensor)
+        if s is None:
+            s = strings[sensor] = len(strings)
+        u = strings.get(unit)
+        if u is None:
+            u = strings[unit] = len(strings)
+        value(v)
+        recorded(recorded_timestamp)
+        received(received_timestamp)
+        sensor_index(s)
+        unit_index(u)
+
+    if len(strings) > 0xFFFF:
+        raise ValueError("too many distinct sensors and units for the columnar encoding")
+
+    dictionary = b"".join(("" if s is None else s).encode("utf-8") + b"\0" for s in strings)
+    parts = [
+        HEADER.pack(MAGIC, VERSION, len(columns["value"]), len(strings), len(dictionary), 0),
+        dictionary,
+        _padding(len(dictionary)),
+    ]
+    for name, _ in COLUMNS:
+        column = columns[name]
+        if sys.byteorder == "big":
+            column.byteswap()
+        data = column.tobytes()
+        parts.append(data)
+        parts.append(_padding(len(data)))
+    return b"".join(parts)
+
+
+def decode(buffer) -> dict:
+    """
+    The inverse of encode(). Columns are returned as memoryviews onto
+    the buffer, not copies. Sensor and unit are indexes into "strings".
+    On a big-endian machine use numpy.frombuffer with "<" dtypes instead.
+    """
+    view = memoryview(buffer)
+    magic, version, count, nstrings, strings_length, _ = HEADER.unpack_from(view)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("not a version 1 columnar reading buffer")
+
+    offset = HEADER.size
+    strings = bytes(view[offset : offset + strings_length]).split(b"\0")[:nstrings]
+    offset += strings_length + len(_padding(strings_length))
+
+    result = {"count": count, "strings": [s.decode("utf-8") for s in strings]}
+    for name, typecode in COLUMNS:
+        size = struct.calcsize(typecode) * count
+        result[name] = view[offset : offset + size].cast(typecode)
+        offset += size + len(_padding(size))
+    return result
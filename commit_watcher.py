@@ -0,0 +1,91 @@
+"""
+Notice readings committed by other worker processes.
+
+Each worker keeps its own latest readings, response cache and /stream
+subscribers, and only hears about the readings it wrote itself. When
+there are several workers this polls the database for new rows instead
+and hands every worker's readings, its own included, to on_commit.
+
+Rows are found by rowid. Writes are serialized so each partition's
+rowids are committed in increasing order, and "rowid > the last one
+seen" is a seek however busy the table is.
+
+Copyright (c) 2025 Timothy Norman Murphy <tnmurphy@gmail.com>
+
+See the LICENSE file in the current directory
+"""
+
+import threading
+
+from sqlalchemy import func, literal_column, select
+from sqlmodel import Session
+
+import logger
+from sensor_reading import SensorReading
+
+
+class CommitWatcher:
+    def __init__(self, engine, on_commit, interval: float = 0.25):
+        self.engine = engine
+        self.on_commit = on_commit
+        self.interval = interval
+        self.logger = logger.RequestLogger("commit_watcher")
+        self._last_rowids = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self.polls = 0
+        self.rows = 0
+
+    def start(self):
+        # Only readings committed from now on are news
+        self._last_rowids = self.last_rowids()
+        self._thread = threading.Thread(target=self._run, name="commit_watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def last_rowids(self) -> dict:
+        """The newest rowid of each partition, a seek each"""
+        rowid = literal_column("rowid")
+        with Session(self.engine) as session:
+            return {
+                table.name: session.execute(select(func.max(rowid)).select_from(table)).scalar() or 0
+                for table in SensorReading.partitions(session)
+            }
+
+    def poll(self) -> list:
+        """The rows committed since the last poll"""
+        rowid = literal_column("rowid")
+        new_rows = []
+        last_rowids = {}
+        with Session(self.engine) as session:
+            for table in SensorReading.partitions(session):
+                last = self._last_rowids.get(table.name, 0)
+                rows = session.execute(
+                    select(rowid, *table.c).where(rowid > last).order_by(rowid)
+                ).all()
+                if rows:
+                    last = rows[-1][0]
+                    new_rows.extend(row[1:] for row in rows)
+                last_rowids[table.name] = last
+        # Dropped partitions are forgotten
+        self._last_rowids = last_rowids
+        self.polls += 1
+        self.rows += len(new_rows)
+        if new_rows:
+            self.on_commit(new_rows)
+        return new_rows
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                self.logger.exception(f"commit_watcher: poll failed: {e}")
+
+    def stats(self) -> dict:
+        return {"polls": self.polls, "rows": self.rows}
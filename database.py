@@ -28,15 +28,270 @@ SOFTWARE.
 
 """
 
-from sqlmodel import create_engine, SQLModel
-from sensor_reading import SensorReading
+import argparse
+import contextlib
+import os
+import threading
+import time
+
+from sqlalchemy import event, func, insert, inspect, select, text
+from sqlmodel import create_engine as sqlmodel_create_engine, Session, SQLModel
+import database_executor
+import logger
+import metrics
+from sensor_reading import (
+    SensorReading,
+    ROLLUPS,
+    create_partition,
+    partition_name,
+    partition_names,
+    partition_range,
+    partition_table,
+)
 
 production_db = "sqlite:///monitor.db"
 test_db = "sqlite:///test_monitor.db"
 
+# PRAGMAs set on every new connection. "default" leaves SQLite as it is:
+# a rollback journal and synchronous=FULL, so every commit is several
+# fsyncs on the SD card. "performance" uses a write-ahead log, which only
+# needs an fsync at checkpoints with synchronous=NORMAL and lets readers
+# carry on while a write is in progress, plus more cache and memory mapping.
+PROFILES = {
+    "default": {},
+    "performance": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -8000,  # KiB, per connection
+        "mmap_size": 256 * 1024 * 1024,
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,  # ms to wait for another writer
+    },
+}
+
+# /sense and /read do their database work on database_executor's
+# writer and reader threads, and maintenance, the commit watcher and
+# the write-behind buffer have a thread each, so keep a connection open
+# for every one of them. /aggregate, /latest and the other plain def
+# endpoints still run on uvicorn's threads and borrow from the overflow
+# when they're busy.
+BACKGROUND_THREADS = 3
+MAX_OVERFLOW = 16
+
+
+def pool_size() -> int:
+    return 1 + database_executor.readers_from_environment() + BACKGROUND_THREADS
+
+
+
+def create_engine(url, profile: str = None):
+    """
+    An engine whose connections are set up with the PRAGMAs of the
+    profile - TMONITOR_DB_PROFILE, or "performance", by default.
+    """
+    if profile is None:
+        profile = os.getenv("TMONITOR_DB_PROFILE", "performance")
+    pragmas = PROFILES[profile]
+
+    kwargs = {}
+    if url.startswith("sqlite:///") and url != "sqlite:///:memory:":
+        kwargs = {
+            "pool_size": int(os.getenv("TMONITOR_DB_POOL_SIZE", pool_size())),
+            "max_overflow": MAX_OVERFLOW,
+        }
+    engine = sqlmodel_create_engine(url, **kwargs)
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    return engine
+
+
+def workers() -> int:
+    """How many worker processes share the database, from startup.py"""
+    return int(os.getenv("TMONITOR_WORKERS", "1"))
+
+
+class WriteLock:
+    """
+    An exclusive lock on a file next to the database, held by a worker
+    process for each write transaction. Without it workers that want to
+    write at the same moment are left to SQLite, which makes them retry
+    with sleeps until busy_timeout runs out. This way they queue.
+    """
+
+    def __init__(self, path: str):
+        import fcntl
+
+        self._fcntl = fcntl
+        self._lock = threading.Lock()  # flock is per process, not per thread
+        self._file = open(path, "a")
+
+    def __enter__(self):
+        self._lock.acquire()
+        self._fcntl.flock(self._file, self._fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        self._fcntl.flock(self._file, self._fcntl.LOCK_UN)
+        self._lock.release()
+
+
+_write_locks = {}
+_write_locks_lock = threading.Lock()
+
+
+def write_lock(engine):
+    """
+    Hold this while writing to the database. It only does anything
+    when there are several worker processes.
+    """
+    path = engine.url.database
+    if workers() <= 1 or not path or path == ":memory:":
+        return contextlib.nullcontext()
+    with _write_locks_lock:
+        lock = _write_locks.get(path)
+        if lock is None:
+            lock = _write_locks[path] = WriteLock(path + ".write-lock")
+    return lock
+
+
+def commit(session):
+    """ Commit new readings, timed for /metrics """
+    start = time.perf_counter()
+    session.commit()
+    metrics.observe(metrics.COMMIT_SECONDS, time.perf_counter() - start)
+
+
+class Maintenance:
+    """
+    A background thread that checkpoints the write-ahead log now and
+    then, so it doesn't keep growing while readers are busy, and has
+    SQLite refresh its query planner statistics once in a while. With
+    retention_days it also drops the monthly partitions of readings
+    that are all older than that.
+    """
+
+    def __init__(
+        self,
+        engine,
+        checkpoint_seconds: float = 300,
+        optimize_seconds: float = 6 * 3600,
+        retention_days: float = None,
+    ):
+        self.engine = engine
+        self.checkpoint_seconds = checkpoint_seconds
+        self.optimize_seconds = optimize_seconds
+        self.retention_days = retention_days
+        self.logger = logger.RequestLogger("db_maintenance")
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="db_maintenance", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def checkpoint(self):
+        with self.engine.connect() as connection:
+            connection.execute(text("PRAGMA wal_checkpoint(PASSIVE)"))
+
+    def optimize(self):
+        with self.engine.connect() as connection:
+            connection.execute(text("PRAGMA optimize"))
+
+    def expire(self) -> list[str]:
+        if self.retention_days is None:
+            return []
+        return drop_partitions(self.engine, before=int(time.time() - self.retention_days * 86400))
+
+    def _attempt(self, task):
+        # A locked database or another worker's DROP mustn't end the thread
+        try:
+            task()
+        except Exception as e:
+            self.logger.exception(f"db_maintenance: {task.__name__} failed: {e}")
+
+    def _run(self):
+        since_optimize = 0.0
+        self._attempt(self.expire)
+        while not self._stop.wait(self.checkpoint_seconds):
+            self._attempt(self.expire)
+            self._attempt(self.checkpoint)
+            since_optimize += self.checkpoint_seconds
+            if since_optimize >= self.optimize_seconds:
+                self._attempt(self.optimize)
+                since_optimize = 0.0
+
+
+def maintenance_from_environment(engine) -> Maintenance:
+    retention_days = os.getenv("TMONITOR_RETENTION_DAYS")
+    return Maintenance(engine, retention_days=float(retention_days) if retention_days else None)
+
+
+def drop_partitions(engine, before: int = None) -> list[str]:
+    """
+    Drop every monthly partition of readings recorded before the
+    timestamp, or all of them. Dropping a table frees its pages for
+    reuse without touching each row as a DELETE would. The rollups
+    are left alone so aggregates of the dropped readings remain.
+    """
+    with write_lock(engine), Session(engine) as session:
+        dropped = [
+            name
+            for name in partition_names(session)
+            if before is None or partition_range(name)[1] <= before
+        ]
+        for name in dropped:
+            # Another worker's maintenance might get there first
+            session.execute(text(f'DROP TABLE IF EXISTS "{name}"'))
+        session.commit()
+    return dropped
+
+
+def partition_readings(engine) -> int:
+    """
+    Move readings stored before there were partitions into them, a
+    month at a time. Returns how many were moved.
+    """
+    table = SensorReading.__table__
+    recorded = table.c.recorded_timestamp
+    moved = duplicates = 0
+    with Session(engine) as session:
+        while True:
+            # Locked a month at a time so other workers can write in between
+            with write_lock(engine):
+                first = session.execute(select(func.min(recorded))).scalar()
+                if first is None:
+                    break
+                name = partition_name(first)
+                _, end = partition_range(name)
+                partition = create_partition(session, name)
+                month = select(*table.c).where(recorded < end)
+                result = session.execute(
+                    insert(partition).from_select([c.name for c in table.c], month).prefix_with("OR IGNORE")
+                )
+                moved += result.rowcount
+                duplicates += session.execute(table.delete().where(recorded < end)).rowcount - result.rowcount
+                session.commit()
+    if duplicates:
+        # They were already in a partition, and counted twice by the rollups
+        rebuild_rollups(engine)
+    return moved
+
 
 def new_test_database(app):
     app.state.engine = create_engine(test_db)
+    drop_partitions(app.state.engine)
     SQLModel.metadata.drop_all(app.state.engine)
     SQLModel.metadata.create_all(app.state.engine)
 
@@ -45,10 +300,65 @@ def add_engine_to_app(app, dburl):
     app.state.engine = create_engine(dburl)
 
 
+def migrate(engine):
+    """
+    Bring an existing database up to date. create_all() only creates
+    missing tables so indexes added to a table since it was created
+    have to be added here.
+    """
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+    with Session(engine) as session:
+        partitions = [partition_table(name) for name in partition_names(session)]
+    for table in partitions:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+
+
+def rebuild_rollups(engine):
+    """
+    Recalculate the rollup tables from the raw readings, e.g. for
+    a database that has readings from before rollups existed.
+    """
+    with write_lock(engine), Session(engine) as session:
+        for rollup in ROLLUPS.values():
+            rollup.rebuild(session)
+        session.commit()
+
+
 def make_database(url=production_db):
     engine = create_engine(url)
+    existing = inspect(engine).get_table_names()
     SQLModel.metadata.create_all(engine)
+    migrate(engine)
+    if SensorReading.__tablename__ in existing and any(
+        rollup.__tablename__ not in existing for rollup in ROLLUPS.values()
+    ):
+        rebuild_rollups(engine)
+    partition_readings(engine)
+    Maintenance(engine).optimize()
 
 
 if __name__ == "__main__":
-    make_database()
+    parser = argparse.ArgumentParser(description="Create or upgrade the database.")
+    parser.add_argument(
+        "operation",
+        nargs="?",
+        choices=["create", "rebuild-rollups", "expire"],
+        default="create",
+        help="'create' (the default) also upgrades an existing database",
+    )
+    parser.add_argument("--url", default=production_db, help="database URL")
+    parser.add_argument(
+        "--retention-days", type=float, default=90, help="for 'expire', how many days of readings to keep"
+    )
+    args = parser.parse_args()
+
+    if args.operation == "create":
+        make_database(args.url)
+    elif args.operation == "rebuild-rollups":
+        rebuild_rollups(create_engine(args.url))
+    elif args.operation == "expire":
+        for name in Maintenance(create_engine(args.url), retention_days=args.retention_days).expire():
+            print(f"dropped {name}")
@@ -0,0 +1,77 @@
+"""
+Threads that do the database work of the async endpoints.
+
+FastAPI runs plain def endpoints in one pool of 40 threads, so forty
+slow /read requests leave /sense waiting for a thread however quick
+its insert would be. Instead, all writes go to a single writer thread
+(SQLite only has one writer at a time anyway, so more would just wait
+on the lock) and reads to a small pool of their own. Reads of a week
+of data can then only hold each other up, and with WAL they never
+block the writer.
+
+Copyright (c) 2025 Timothy Norman Murphy <tnmurphy@gmail.com>
+
+See the LICENSE file in the current directory
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import os
+
+
+class DatabaseExecutor:
+    def __init__(self, readers: int = 4):
+        self.readers = readers
+        self._writer = ThreadPoolExecutor(1, thread_name_prefix="db_writer")
+        self._reader = ThreadPoolExecutor(readers, thread_name_prefix="db_reader")
+        self.writes = 0
+        self.reads = 0
+
+    @staticmethod
+    async def _run(executor, function, *args):
+        # Keep the request's context, e.g. the logging correlator
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(executor, context.run, function, *args)
+
+    async def write(self, function, *args):
+        """function(*args) on the writer thread"""
+        self.writes += 1
+        return await self._run(self._writer, function, *args)
+
+    async def read(self, function, *args):
+        """function(*args) on one of the reader threads"""
+        self.reads += 1
+        return await self._run(self._reader, function, *args)
+
+    async def iterate(self, iterator):
+        """
+        An async iterator over a blocking one, e.g. a generator of
+        rows, that advances it on the reader threads.
+        """
+        done = object()
+        try:
+            while True:
+                item = await self.read(next, iterator, done)
+                if item is done:
+                    break
+                yield item
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                await self.read(close)
+
+    def shutdown(self):
+        self._writer.shutdown(wait=True)
+        self._reader.shutdown(wait=True)
+
+    def stats(self) -> dict:
+        return {"readers": self.readers, "writes": self.writes, "reads": self.reads}
+
+
+def readers_from_environment() -> int:
+    return int(os.getenv("TMONITOR_DB_READERS", "4"))
+
+
+def from_environment() -> DatabaseExecutor:
+    return DatabaseExecutor(readers=readers_from_environment())
@@ -0,0 +1,92 @@
+"""
+Min/max decimation of sensor readings for charts.
+
+A chart a few hundred pixels wide can't show more than a few hundred
+points per line, but it does need the peaks and troughs. Each sensor's
+time range is divided into max_points / 2 slots and only the lowest
+and highest reading in each slot is kept, so the shape of the line
+survives while the number of points doesn't depend on the period.
+
+Readings are fed in one at a time as they come from the database, in
+any order, so memory depends on max_points and not on how many
+readings there were.
+
+Copyright (c) 2025 Timothy Norman Murphy <tnmurphy@gmail.com>
+
+See the LICENSE file in the current directory
+"""
+
+from array import array
+
+# Columns of the rows that are fed to MinMaxDecimator.add
+SENSOR, UNIT, VALUE, RECORDED, RECEIVED = range(5)
+
+
+class _Series:
+    """The slots for one sensor"""
+
+    def __init__(self, first: int, last: int, slots: int):
+        self.first = first
+        self.slots = slots
+        self.width = (last - first + 1) / slots
+        self.low = array("d", [float("inf")]) * slots
+        self.high = array("d", [float("-inf")]) * slots
+        self.low_rows = [None] * slots
+        self.high_rows = [None] * slots
+
+
+class MinMaxDecimator:
+    def __init__(self, max_points: int, ranges: dict):
+        """
+        ranges maps each sensor to the (first, last) recorded_timestamp
+        that will be seen for it.
+        """
+        slots = max(1, max_points // 2)
+        self.series = {
+            sensor: _Series(first, last, slots) for sensor, (first, last) in ranges.items()
+        }
+
+    def add(self, row):
+        """
+        row is (sensor, unit, value, recorded_timestamp, received_timestamp).
+        Readings committed after the ranges were read may be of another
+        sensor, which are ignored, or outside the range, which go in the
+        nearest slot.
+        """
+        series = self.series.get(row[SENSOR])
+        if series is None:
+            return
+        slot = min(max(int((row[RECORDED] - series.first) / series.width), 0), series.slots - 1)
+        value = row[VALUE]
+        if value < series.low[slot]:
+            series.low[slot] = value
+            series.low_rows[slot] = row
+        if value > series.high[slot]:
+            series.high[slot] = value
+            series.high_rows[slot] = row
+
+    def readings(self) -> list[dict]:
+        """The kept readings, sensor by sensor, in recorded_timestamp order"""
+        result = []
+        for sensor in sorted(self.series):
+            series = self.series[sensor]
+            for low, high in zip(series.low_rows, series.high_rows):
+                if low is None:
+                    continue
+                if low is high:
+                    kept = (low,)
+                elif low[RECORDED] <= high[RECORDED]:
+                    kept = (low, high)
+                else:
+                    kept = (high, low)
+                for row in kept:
+                    result.append(
+                        {
+                            "sensor": row[SENSOR],
+                            "unit": row[UNIT],
+                            "value": row[VALUE],
+                            "recorded_timestamp": row[RECORDED],
+                            "received_timestamp": row[RECEIVED],
+                        }
+                    )
+        return result
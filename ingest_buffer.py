@@ -0,0 +1,236 @@
+"""
+Optional write-behind buffer for /sense.
+
+Without it every POST to /sense does its own commit (and so its own fsync)
+and, with many probes reporting on the same 5 minute boundary, the commits
+queue up behind SQLite's single writer. With the buffer enabled a
+background thread writes everything queued in one transaction every
+flush_ms milliseconds or whenever flush_rows readings are waiting, and
+each request is answered once the flush holding its readings has been
+committed. Probes delete readings from their spools when they get that
+answer, so it's never given for readings that are only in memory.
+
+The queue is bounded: when it's full /sense answers 503 with a
+Retry-After header and the probe keeps the readings to send later.
+
+Copyright (c) 2025 Timothy Norman Murphy <tnmurphy@gmail.com>
+
+See the LICENSE file in the current directory
+"""
+
+from concurrent.futures import Future
+import math
+import os
+import threading
+import time
+
+from sqlmodel import Session
+
+import logger
+import database
+from sensor_reading import SensorReading, SensorReadingPayload
+
+
+class IngestBufferFull(Exception):
+    """The buffer can't take any more readings until it has flushed."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"ingest buffer full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class IngestBuffer:
+    def __init__(
+        self,
+        engine,
+        flush_ms: int = 200,
+        flush_rows: int = 5000,
+        max_pending_rows: int = 50000,
+        on_commit=None,
+    ):
+        """
+        on_commit, if given, is called from the flushing thread with the
+        rows that were inserted each time a flush has been committed.
+        """
+        self.engine = engine
+        self.on_commit = on_commit
+        self.flush_ms = flush_ms
+        self.flush_rows = flush_rows
+        self.max_pending_rows = max_pending_rows
+        self.logger = logger.RequestLogger("ingest_buffer")
+
+        self._condition = threading.Condition()
+        self._pending = []  # list of (received_timestamp, payloads, future)
+        self._pending_rows = 0
+        self._oldest = None
+        self._stopping = False
+        self._thread = None
+
+        self.flushes = 0
+        self.rows_flushed = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.failed = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+    @property
+    def retry_after(self) -> int:
+        """Seconds a rejected probe should wait - roughly one flush."""
+        return max(1, math.ceil(self.flush_ms / 1000))
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name="ingest_buffer", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float = 30.0):
+        """Stop accepting readings and flush everything still queued."""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        else:
+            self._flush(self._take())
+
+    def submit(self, payloads: list[SensorReadingPayload]) -> Future:
+        """
+        Queue a batch of readings. They all get the time of submission
+        as their received_timestamp, just as they would if they had been
+        written immediately. Raises IngestBufferFull if there's no room.
+        The future's result is the rows inserted from this batch once
+        they're committed, or the exception that stopped them being
+        written.
+        """
+        received = int(time.time())
+        future = Future()
+        with self._condition:
+            if self._stopping or self._pending_rows + len(payloads) > self.max_pending_rows:
+                self.rejected += len(payloads)
+                raise IngestBufferFull(self.retry_after)
+            if not self._pending:
+                self._oldest = time.monotonic()
+            self._pending.append((received, payloads, future))
+            self._pending_rows += len(payloads)
+            if self._pending_rows >= self.flush_rows:
+                self._condition.notify()
+        return future
+
+    def stats(self) -> dict:
+        with self._condition:
+            pending_rows = self._pending_rows
+        return {
+            "pending_rows": pending_rows,
+            "max_pending_rows": self.max_pending_rows,
+            "flushes": self.flushes,
+            "rows_flushed": self.rows_flushed,
+            "duplicates": self.duplicates,
+            "rejected": self.rejected,
+            "failed": self.failed,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "max_flush_ms": round(self.max_flush_ms, 3),
+            "mean_flush_ms": round(self.total_flush_ms / self.flushes, 3) if self.flushes else 0.0,
+        }
+
+    def _take(self):
+        with self._condition:
+            batches = self._pending
+            self._pending = []
+            self._pending_rows = 0
+            self._oldest = None
+        return batches
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._stopping:
+                    if self._pending_rows >= self.flush_rows:
+                        break
+                    if self._oldest is None:
+                        self._condition.wait()
+                        continue
+                    remaining = self._oldest + self.flush_ms / 1000 - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                stopping = self._stopping
+            batches = self._take()
+            try:
+                self._flush(batches)
+            except Exception as e:
+                self.logger.exception(f"ingest_buffer: flush failed: {e}")
+                for _, _, future in batches:
+                    if not future.done():
+                        future.set_exception(e)
+            if stopping:
+                return
+
+    def _flush(self, batches):
+        if not batches:
+            return
+        start = time.perf_counter()
+        failed = 0
+        inserted = []
+        try:
+            written = self._write(batches)
+        except Exception:
+            # Something in this lot is bad. Write each request's batch on
+            # its own so that one bad probe can't lose everyone's readings.
+            self.logger.exception("ingest_buffer: flush failed, retrying batches singly")
+            written = []
+            for batch in batches:
+                try:
+                    written.extend(self._write([batch]))
+                except Exception as e:
+                    failed += len(batch[1])
+                    batch[2].set_exception(e)
+                    self.logger.exception(f"ingest_buffer: failed to write {len(batch[1])} readings")
+        for future, rows in written:
+            inserted.extend(rows)
+            future.set_result(rows)
+
+        elapsed = (time.perf_counter() - start) * 1000
+        submitted = sum(len(payloads) for _, payloads, _ in batches)
+        self.flushes += 1
+        self.rows_flushed += len(inserted)
+        self.duplicates += submitted - len(inserted) - failed
+        self.failed += failed
+        self.last_flush_ms = elapsed
+        self.max_flush_ms = max(self.max_flush_ms, elapsed)
+        self.total_flush_ms += elapsed
+        if self.on_commit is not None and inserted:
+            try:
+                self.on_commit(inserted)
+            except Exception as e:
+                self.logger.exception(f"ingest_buffer: on_commit failed: {e}")
+
+    def _write(self, batches):
+        """ Write batches in one transaction, returning (future, rows) for each """
+        written = []
+        with database.write_lock(self.engine), Session(self.engine) as session:
+            for received, payloads, future in batches:
+                written.append((future, SensorReading.ingest(session, payloads, received)))
+            database.commit(session)
+        return written
+
+
+def from_environment(engine, on_commit=None):
+    """
+    Build and start an IngestBuffer if TMONITOR_WRITE_BEHIND is set,
+    otherwise return None and /sense writes directly.
+    """
+    if os.getenv("TMONITOR_WRITE_BEHIND", "0").lower() in ("", "0", "false", "no"):
+        return None
+    buffer = IngestBuffer(
+        engine,
+        flush_ms=int(os.getenv("TMONITOR_FLUSH_MS", "200")),
+        flush_rows=int(os.getenv("TMONITOR_FLUSH_ROWS", "5000")),
+        max_pending_rows=int(os.getenv("TMONITOR_MAX_PENDING_ROWS", "50000")),
+        on_commit=on_commit,
+    )
+    buffer.start()
+    return buffer
@@ -0,0 +1,95 @@
+"""
+The latest reading of every sensor, kept in memory.
+
+"What's the temperature now" is the question asked most often, so
+the answer is kept up to date as readings are committed instead of
+being queried from the database. It's loaded from the database once,
+when it's created.
+
+Copyright (c) 2025 Timothy Norman Murphy <tnmurphy@gmail.com>
+
+See the LICENSE file in the current directory
+"""
+
+import hashlib
+import json
+import threading
+
+from sqlmodel import Session, select
+
+from sensor_reading import SensorReading, DailyRollup
+
+
+class LatestReadings:
+    def __init__(self, engine):
+        self.engine = engine
+        self._lock = threading.Lock()
+        self._readings = {}
+        self._body = None
+        self._etag = None
+        self.version = 0
+        self.warm()
+
+    def warm(self):
+        """
+        Load the newest reading of each sensor. Every sensor has at least
+        one daily rollup so that small table gives the list of sensors, and
+        then each lookup is a seek on the primary key of a partition.
+        """
+        with Session(self.engine) as session:
+            sensors = session.exec(select(DailyRollup.sensor).distinct()).all()
+            latest = {}
+            for sensor in sensors:
+                reading = SensorReading.fetch_latest(session, sensor)
+                if reading is not None:
+                    latest[sensor] = reading.model_dump()
+        with self._lock:
+            self._readings = latest
+            self._changed()
+
+    def update(self, rows):
+        """
+        rows are SensorReading rows that have just been committed.
+        Readings older than the one already held, e.g. from a replayed
+        backlog, don't replace it.
+        """
+        changed = False
+        with self._lock:
+            for sensor, unit, value, recorded_timestamp, received_timestamp in rows:
+                current = self._readings.get(sensor)
+                if current is None or recorded_timestamp >= current["recorded_timestamp"]:
+                    self._readings[sensor] = {
+                        "sensor": sensor,
+                        "unit": unit,
+                        "value": float(value),
+                        "recorded_timestamp": recorded_timestamp,
+                        "received_timestamp": received_timestamp,
+                    }
+                    changed = True
+            if changed:
+                self._changed()
+
+    def _changed(self):
+        self.version += 1
+        self._body = None
+
+    @property
+    def etag(self) -> str:
+        return self.body()[0]
+
+    def readings(self) -> dict:
+        with self._lock:
+            return dict(self._readings)
+
+    def body(self) -> tuple[str, bytes]:
+        """
+        The ETag and the json for /latest, encoded once per version. The
+        ETag is a hash of the json so every worker process, and a
+        restarted server, gives the same readings the same ETag.
+        """
+        with self._lock:
+            if self._body is None:
+                readings = [self._readings[sensor] for sensor in sorted(self._readings)]
+                self._body = json.dumps({"readings": readings}).encode("utf-8")
+                self._etag = f'"{hashlib.blake2b(self._body, digest_size=8).hexdigest()}"'
+            return self._etag, self._body
@@ -1,7 +1,68 @@
-from typing import List, Dict, Any
+import importlib
+from importlib import metadata
+from typing import List, Dict, Any, Optional
 
 class DeviceReader:
     """Base class for all device readers."""
+    # Seconds between reads and how long a read may take. None means
+    # the probe's defaults.
+    interval: Optional[float] = None
+    timeout: Optional[float] = None
+
     async def read(self) -> List[Dict[str, Any]]:
-        """Read and return a list of sensor readings."""
+        """
+        Read and return a list of sensor readings. This runs on the
+        probe's event loop so blocking I/O belongs in a thread, e.g.
+        with asyncio.to_thread.
+        """
         raise NotImplementedError
+
+
+# Readers that come with the probe, by the name used in the config file
+BUILTIN_READERS = {
+    "sensorhub": "sensorhub:SensorHubReader",
+    "synthetic": "synthetic:SyntheticReader",
+}
+# Packages can add readers under this entry point group
+ENTRY_POINT_GROUP = "tmonitor.readers"
+
+
+def reader_class(name: str) -> type:
+    """
+    The DeviceReader subclass called name: a built-in reader, one
+    installed under the tmonitor.readers entry point group or a
+    "module:Class" path.
+    """
+    path = BUILTIN_READERS.get(name)
+    if path is None:
+        try:
+            entry_points = metadata.entry_points(group=ENTRY_POINT_GROUP)
+        except TypeError:
+            # python 3.9
+            entry_points = metadata.entry_points().get(ENTRY_POINT_GROUP, [])
+        for entry_point in entry_points:
+            if entry_point.name == name:
+                return entry_point.load()
+        path = name
+    module_name, _, class_name = path.partition(":")
+    if not class_name:
+        raise ValueError(f"unknown reader {name!r}, expected one of {', '.join(BUILTIN_READERS)} or module:Class")
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def create_reader(config: Dict[str, Any]) -> DeviceReader:
+    """
+    A reader from its entry in the config file: "type" names the reader,
+    "interval" and "timeout" override the probe's defaults for it and
+    everything else is passed to the reader's constructor.
+    """
+    options = dict(config)
+    cls = reader_class(options.pop("type"))
+    interval = options.pop("interval", None)
+    timeout = options.pop("timeout", None)
+    reader = cls(**options)
+    if interval is not None:
+        reader.interval = interval
+    if timeout is not None:
+        reader.timeout = timeout
+    return reader
@@ -1,63 +1,148 @@
+import argparse
 import asyncio
+import gzip
+import json
+import random
 import uvloop
 import aiohttp
 from typing import List, Dict, Any
-from devicereader import DeviceReader
-from time import time
+from devicereader import create_reader
+from scheduler import run_readers
+from spool import Spool
+import time
 
 DEFAULT_INTERVAL=300
+# Seconds a reader may take before it's reported as stuck
+DEFAULT_TIMEOUT=30
 POST_URL="http://chivero:5000/sense"
+# Readings per POST when sending what's in the spool
+BATCH_SIZE=1000
+# Seconds to wait after a failed POST, doubling each time up to MAX_BACKOFF
+MIN_BACKOFF=1
+MAX_BACKOFF=300
+# Replies that mean the batch itself is bad so retrying it can't help
+REJECTED={400, 413, 422}
+# Used for anything the config file doesn't say
+DEFAULT_CONFIG={
+    "url": POST_URL,
+    "interval": DEFAULT_INTERVAL,
+    "timeout": DEFAULT_TIMEOUT,
+    "spool": "tprobe-spool.db",
+    "readers": [{"type": "sensorhub"}],
+}
 
-async def read_devices(queue: asyncio.Queue, readers: List[DeviceReader]) -> None:
-    """Read from all devices and enqueue the readings."""
-    while True:
-        for reader in readers:
-            try:
-                print("tprobe: reading...")
-                readings = await reader.read()
-                await queue.put(readings)
-                print(f"tprobe: enqueued {len(readings)} readings at {asyncio.get_event_loop().time()}")
-                print(f"tprobe: Readings: {readings}")
-            except Exception as e:
-                print(f"tprobe: error reading from device: {e}")
-        await asyncio.sleep(DEFAULT_INTERVAL)
+class Counts:
+    """Readings read and sent, for reporting the rate"""
+    def __init__(self, verbose: bool = True):
+        self.verbose = verbose
+        self.read = 0
+        self.sent = 0
+
+def spool_readings(spool: Spool, ready: asyncio.Event, counts: Counts, readings: List[Dict[str, Any]]) -> None:
+    """Add a reader's readings to the spool and wake the sender."""
+    spool.add(readings)
+    ready.set()
+    counts.read += len(readings)
+    if counts.verbose:
+        print(f"tprobe: spooled {len(readings)} readings, {len(spool)} waiting to be sent")
+        print(f"tprobe: Readings: {readings}")
+    if spool.dropped:
+        print(f"tprobe: error: spool full, {spool.dropped} of the oldest readings dropped so far")
 
-async def send_readings(queue: asyncio.Queue, url: str) -> None:
-    """Dequeue readings and send them to the specified URL."""
-    async with aiohttp.ClientSession() as session:
+async def post(session: aiohttp.ClientSession, url: str, readings: List[Dict[str, Any]]) -> aiohttp.ClientResponse:
+    """POST readings as gzipped json"""
+    body = gzip.compress(json.dumps(readings).encode("utf-8"))
+    headers = {"Content-Type": "application/json", "Content-Encoding": "gzip"}
+    async with session.post(url, data=body, headers=headers) as resp:
+        await resp.read()
+        return resp
+
+async def send_readings(spool: Spool, url: str, ready: asyncio.Event, counts: Counts) -> None:
+    """
+    Send what's in the spool, a batch at a time, whenever there's
+    anything in it. After a failure wait before trying again, for
+    longer each time, so that a back-end that's just come back isn't
+    swamped by every probe at once.
+    """
+    backoff = MIN_BACKOFF
+    timeout = aiohttp.ClientTimeout(total=60)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
         while True:
-            readings = await queue.get()
+            last_id, readings = spool.peek(BATCH_SIZE)
+            if not readings:
+                ready.clear()
+                await ready.wait()
+                continue
+            delay = None
             try:
-                async with session.post(url, json=readings) as resp:
-                    if resp.status == 200:
+                resp = await post(session, url, readings)
+                if resp.status == 200:
+                    spool.remove(last_id)
+                    backoff = MIN_BACKOFF
+                    counts.sent += len(readings)
+                    if counts.verbose:
                         print(f"tprobe: sent {len(readings)} readings to {url} at {time.time()}")
-                    else:
-                        print(f"tprobe: error: failed to send readings: {resp.status}")
+                elif resp.status in REJECTED:
+                    spool.remove(last_id)
+                    print(f"tprobe: error: {len(readings)} readings rejected and dropped: {resp.status}")
+                else:
+                    print(f"tprobe: error: failed to send readings: {resp.status}")
+                    delay = backoff
+                    if resp.headers.get("Retry-After", "").isdigit():
+                        delay = max(delay, int(resp.headers["Retry-After"]))
             except Exception as e:
                 print(f"tprobe: error sending readings: {e}")
-            queue.task_done()
-
-async def main(interval: int = DEFAULT_INTERVAL) -> None:
-    global DEFAULT_INTERVAL
-    DEFAULT_INTERVAL = interval
-    queue = asyncio.Queue()
-
-    from sensorhub import SensorHubReader
-    # Initialize your device readers here
-    readers = [
-        SensorHubReader(),
-        # Add more readers here as needed
-    ]
+                delay = backoff
+            if delay is not None:
+                print(f"tprobe: {len(spool)} readings waiting, retrying in {delay}s")
+                await asyncio.sleep(delay * random.uniform(1, 1.25))
+                backoff = min(backoff * 2, MAX_BACKOFF)
+
+async def report(spool: Spool, counts: Counts, every: float) -> None:
+    """Print readings read and sent per second every so often"""
+    start = time.monotonic()
+    while True:
+        await asyncio.sleep(every)
+        elapsed = time.monotonic() - start
+        print(f"tprobe: read {counts.read / elapsed:.1f}/s, sent {counts.sent / elapsed:.1f}/s, "
+              f"{len(spool)} waiting")
+
+def load_config(path: str = None) -> Dict[str, Any]:
+    config = dict(DEFAULT_CONFIG)
+    if path is not None:
+        with open(path) as f:
+            config.update(json.load(f))
+    return config
+
+async def main(config: Dict[str, Any], report_every: float = None, verbose: bool = True) -> None:
+    spool = Spool(config["spool"])
+    ready = asyncio.Event()
+    # Send anything left over from before a restart
+    ready.set()
+    counts = Counts(verbose)
+
+    readers = [create_reader(reader) for reader in config["readers"]]
+    print(f"tprobe: readers {', '.join(type(reader).__name__ for reader in readers)} sending to {config['url']}")
 
     tasks = [
-        asyncio.create_task(read_devices(queue, readers)),
-        asyncio.create_task(send_readings(queue, POST_URL))
+        asyncio.create_task(
+            run_readers(readers, lambda r: spool_readings(spool, ready, counts, r), config["interval"],
+                        config["timeout"])
+        ),
+        asyncio.create_task(send_readings(spool, config["url"], ready, counts))
     ]
+    if report_every:
+        tasks.append(asyncio.create_task(report(spool, counts, report_every)))
     print("tprobe: starting tasks")
     await asyncio.gather(*tasks)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Read sensors and send the readings to the tmonitor back-end")
+    parser.add_argument("--config", help="json file of settings and readers, see README.md")
+    parser.add_argument("--report", type=float, metavar="SECONDS", help="print readings per second this often")
+    parser.add_argument("--quiet", action="store_true", help="don't print every batch of readings")
+    args = parser.parse_args()
+
     print("tprobe: startup")
     uvloop.install()
-    asyncio.run(main(DEFAULT_INTERVAL))
-
+    asyncio.run(main(load_config(args.config), args.report, not args.quiet))
@@ -0,0 +1,90 @@
+"""
+Run each device reader on its own schedule.
+
+Every reader has a task of its own so a slow or stuck reader can't
+delay the others, or the sender. After a first read at startup, reads
+happen at multiples of the reader's interval on the clock, plus a
+small random offset fixed for each reader so that probes set to the
+same interval don't all read and send at the same instant. Working out
+the next time from the clock, rather than sleeping for interval after
+each read, means the time spent reading doesn't add up to drift, and a
+probe that's been suspended carries on from the next slot instead of
+catching up.
+
+A read that takes longer than its timeout is reported and left to
+finish; no new read of that reader starts until it has, and its
+readings are still kept if it does.
+
+Copyright (c) 2025 Timothy Norman Murphy <tnmurphy@gmail.com>
+
+See the LICENSE file in the current directory
+"""
+
+import asyncio
+import random
+import time
+from typing import Any, Callable, Dict, List
+
+from devicereader import DeviceReader
+
+# At most this many seconds of random offset per reader
+MAX_JITTER = 5.0
+
+
+def next_time(now: float, interval: float, offset: float) -> float:
+    """The first time after now that is a multiple of interval plus offset"""
+    return ((now - offset) // interval + 1) * interval + offset
+
+
+async def run_reader(
+    reader: DeviceReader,
+    on_readings: Callable[[List[Dict[str, Any]]], None],
+    interval: float,
+    timeout: float,
+    jitter: float = MAX_JITTER,
+) -> None:
+    name = type(reader).__name__
+    offset = random.uniform(0, min(jitter, interval / 10))
+    pending = None
+
+    def finished(task: asyncio.Task):
+        if task.cancelled():
+            return
+        try:
+            readings = task.result()
+        except Exception as e:
+            print(f"tprobe: error reading from {name}: {e}")
+            return
+        on_readings(readings)
+
+    while True:
+        if pending is not None and not pending.done():
+            print(f"tprobe: error: {name} is still busy with its last read, skipping this one")
+        else:
+            pending = asyncio.ensure_future(reader.read())
+            pending.add_done_callback(finished)
+            await asyncio.wait({pending}, timeout=timeout)
+            if not pending.done():
+                print(f"tprobe: error: {name} took more than {timeout}s to read")
+        now = time.time()
+        await asyncio.sleep(next_time(now, interval, offset) - now)
+
+
+async def run_readers(
+    readers: List[DeviceReader],
+    on_readings: Callable[[List[Dict[str, Any]]], None],
+    default_interval: float,
+    default_timeout: float,
+) -> None:
+    """Each reader's interval and timeout, if it has them, else the defaults"""
+    await asyncio.gather(
+        *[
+            run_reader(
+                reader,
+                on_readings,
+                reader.interval or default_interval,
+                reader.timeout or min(default_timeout, reader.interval or default_interval),
+            )
+            for reader in readers
+        ]
+    )
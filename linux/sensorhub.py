@@ -1,12 +1,27 @@
-import smbus
+import asyncio
 from devicereader import DeviceReader
 from typing import List, Dict, Any
 import time
 
+# The sensorhub's registers that hold readings. They're all read in one
+# block transfer from FIRST_REGISTER to LAST_REGISTER.
+FIRST_REGISTER = 0x01
+LAST_REGISTER = 0x0D
+LIGHT_L = 0x02
+LIGHT_H = 0x03
+TEMPERATURE = 0x05
+HUMIDITY = 0x06
+PRESSURE_L = 0x09
+PRESSURE_M = 0x0A
+PRESSURE_H = 0x0B
+HUMAN_PRESENCE = 0x0D
+
 class SensorHubReader(DeviceReader):
     """Read from a sensorhub and return probe data"""
-    def __init__(self, bus: smbus.SMBus = None, address: int = 0x17):
+    def __init__(self, bus=None, address: int = 0x17):
         if bus is None:
+            # Only needed on the Pi itself
+            import smbus
             self.bus = smbus.SMBus(1)
         else:
             self.bus = bus
@@ -14,61 +29,27 @@ class SensorHubReader(DeviceReader):
 
     async def read(self) -> List[Dict[str, Any]]:
         """Read and return sensor data from SensorHub."""
-        aReceiveBuf = []
-        aReceiveBuf.append(0x00)  # Placeholder
-        for i in range(0x01, 0x0D + 1):
-            aReceiveBuf.append(self.bus.read_byte_data(self.address, i))
-
-        # Process sensor data
-        readings = []
-        read_time = int(time.time())
-
-        # Temperature
-        temp = self.bus.read_byte_data(self.address, 0x05)
-        readings.append({
-            "sensor": "temperature",
-            "unit": "C",
-            "value": float(temp),
-            "recorded_timestamp": read_time
-        })
+        # smbus blocks, so keep it off the event loop
+        return await asyncio.to_thread(self.read_registers)
 
-        # Humidity
-        humidity = self.bus.read_byte_data(self.address, 0x06)
-        readings.append({
-            "sensor": "humidity",
-            "unit": "%",
-            "value": float(humidity),
-            "recorded_timestamp": read_time
-        })
+    def read_registers(self) -> List[Dict[str, Any]]:
+        # One I2C transaction for every register instead of one per byte
+        block = self.bus.read_i2c_block_data(self.address, FIRST_REGISTER, LAST_REGISTER - FIRST_REGISTER + 1)
+        registers = [0x00] * FIRST_REGISTER + list(block)
 
-        # Light
-        light = (self.bus.read_byte_data(self.address, 0x03) << 8) | (self.bus.read_byte_data(self.address, 0x02))
-        readings.append({
-            "sensor": "light",
-            "unit": "lux",
-            "value": float(light),
-            "recorded_timestamp": read_time
-        })
-
-        # Pressure
-        pressure = (self.bus.read_byte_data(self.address, 0x0B) << 16) | (
-            (self.bus.read_byte_data(self.address, 0x0A) << 8)) | (
-            (self.bus.read_byte_data(self.address, 0x09)))
-        readings.append({
-            "sensor": "pressure",
-            "unit": "kPa",
-            "value": float(pressure),
-            "recorded_timestamp": read_time
-        })
-
-        # Human presence
-        human = self.bus.read_byte_data(self.address, 0x0D)
-        readings.append({
-            "sensor": "human_presence",
-            "unit": "bool",
-            "value": float(human),
-            "recorded_timestamp": read_time
-        })
-
-        return readings
+        read_time = int(time.time())
 
+        def reading(sensor, unit, value):
+            return {"sensor": sensor, "unit": unit, "value": float(value), "recorded_timestamp": read_time}
+
+        return [
+            reading("temperature", "C", registers[TEMPERATURE]),
+            reading("humidity", "%", registers[HUMIDITY]),
+            reading("light", "lux", registers[LIGHT_H] << 8 | registers[LIGHT_L]),
+            reading(
+                "pressure",
+                "kPa",
+                registers[PRESSURE_H] << 16 | registers[PRESSURE_M] << 8 | registers[PRESSURE_L],
+            ),
+            reading("human_presence", "bool", registers[HUMAN_PRESENCE]),
+        ]
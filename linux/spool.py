@@ -0,0 +1,70 @@
+"""
+Readings waiting to be sent to the back-end, kept on disk.
+
+Readings are written to a small SQLite database as soon as they're
+read and only deleted once the back-end has accepted them, so nothing
+is lost when the back-end or the network is down, or when the probe
+restarts. Only a batch at a time is ever read back into memory however
+long the outage. If the spool reaches max_readings the oldest readings
+are dropped to make room.
+
+Copyright (c) 2025 Timothy Norman Murphy <tnmurphy@gmail.com>
+
+See the LICENSE file in the current directory
+"""
+
+import json
+import sqlite3
+from typing import Any, Dict, List, Tuple
+
+DEFAULT_PATH = "tprobe-spool.db"
+MAX_READINGS = 500_000
+
+
+class Spool:
+    def __init__(self, path: str = DEFAULT_PATH, max_readings: int = MAX_READINGS):
+        self.max_readings = max_readings
+        self.dropped = 0
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS pending (id INTEGER PRIMARY KEY AUTOINCREMENT, reading TEXT NOT NULL)"
+        )
+        self.connection.commit()
+
+    def __len__(self) -> int:
+        # Readings are only ever deleted from the oldest end so the ids
+        # are contiguous, and this is two seeks instead of a count(*).
+        count = self.connection.execute("SELECT max(id) - min(id) + 1 FROM pending").fetchone()[0]
+        return count or 0
+
+    def add(self, readings: List[Dict[str, Any]]):
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO pending (reading) VALUES (?)", [(json.dumps(r),) for r in readings]
+            )
+            excess = len(self) - self.max_readings
+            if excess > 0:
+                self.connection.execute(
+                    "DELETE FROM pending WHERE id IN (SELECT id FROM pending ORDER BY id LIMIT ?)", (excess,)
+                )
+                self.dropped += excess
+
+    def peek(self, limit: int) -> Tuple[int, List[Dict[str, Any]]]:
+        """
+        The oldest readings, at most limit of them, and the id to pass
+        to remove() once they've been sent. (None, []) when it's empty.
+        """
+        rows = self.connection.execute("SELECT id, reading FROM pending ORDER BY id LIMIT ?", (limit,)).fetchall()
+        if not rows:
+            return None, []
+        return rows[-1][0], [json.loads(reading) for _, reading in rows]
+
+    def remove(self, last_id: int):
+        """Forget the readings up to and including last_id"""
+        with self.connection:
+            self.connection.execute("DELETE FROM pending WHERE id <= ?", (last_id,))
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,71 @@
+"""
+A reader that makes readings up, for running the probe without any
+hardware and for finding out how fast the whole pipeline can go.
+
+It produces count sensors named prefix_0, prefix_1... whose values
+follow a pattern: "sine" (period seconds per cycle), "random_walk",
+"square" or "constant", around base and within amplitude of it.
+
+The back-end treats two readings of a sensor with the same
+recorded_timestamp as the same reading, and timestamps are in whole
+seconds, so when reading more often than once a second each read's
+timestamp is one second on from the last one rather than the real
+time. Timestamps run ahead of the clock at such rates but every
+reading is stored.
+
+Copyright (c) 2025 Timothy Norman Murphy <tnmurphy@gmail.com>
+
+See the LICENSE file in the current directory
+"""
+
+import math
+import random
+import time
+from typing import Any, Dict, List
+
+from devicereader import DeviceReader
+
+PATTERNS = ("sine", "random_walk", "square", "constant")
+
+
+class SyntheticReader(DeviceReader):
+    def __init__(
+        self,
+        count: int = 4,
+        prefix: str = "synthetic",
+        unit: str = "C",
+        pattern: str = "sine",
+        base: float = 20.0,
+        amplitude: float = 5.0,
+        period: float = 3600.0,
+    ):
+        if pattern not in PATTERNS:
+            raise ValueError(f"unknown pattern {pattern!r}, expected one of {', '.join(PATTERNS)}")
+        self.sensors = [f"{prefix}_{i}" for i in range(count)]
+        self.unit = unit
+        self.pattern = pattern
+        self.base = base
+        self.amplitude = amplitude
+        self.period = period
+        self.walk = [base] * count
+        self.last_timestamp = 0
+
+    def value(self, i: int, t: int) -> float:
+        # Each sensor is a little out of phase with the others
+        phase = 2 * math.pi * (t / self.period + i / len(self.sensors))
+        if self.pattern == "sine":
+            return self.base + self.amplitude * math.sin(phase)
+        if self.pattern == "square":
+            return self.base + (self.amplitude if math.sin(phase) >= 0 else -self.amplitude)
+        if self.pattern == "random_walk":
+            step = random.uniform(-self.amplitude, self.amplitude) / 10
+            self.walk[i] = min(self.base + self.amplitude, max(self.base - self.amplitude, self.walk[i] + step))
+            return self.walk[i]
+        return self.base
+
+    async def read(self) -> List[Dict[str, Any]]:
+        t = self.last_timestamp = max(int(time.time()), self.last_timestamp + 1)
+        return [
+            {"sensor": sensor, "unit": self.unit, "value": round(self.value(i, t), 3), "recorded_timestamp": t}
+            for i, sensor in enumerate(self.sensors)
+        ]
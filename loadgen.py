@@ -0,0 +1,165 @@
+"""
+Simulated probes and dashboards for load testing the back-end.
+
+Probes post batches of readings for their sensors, optionally after
+replaying a backlog as a probe does when it comes back online, while
+readers make a mix of the queries the web app makes. Every request's
+latency is recorded per kind of request. Used by "mtool.py bench".
+
+Copyright (c) 2025 Timothy Norman Murphy <tnmurphy@gmail.com>
+
+See the LICENSE file in the current directory
+"""
+
+import asyncio
+from dataclasses import dataclass, field, asdict
+import random
+import time
+
+# The queries a reader can make and how often, relative to each other,
+# by default
+READ_MIX = {"read": 4, "latest": 4, "aggregate": 1, "downsample": 1}
+
+
+@dataclass
+class LoadProfile:
+    probes: int = 10
+    sensors: int = 4  # per probe
+    batch: int = 4  # readings per /sense request
+    interval: float = 1.0  # seconds between a probe's requests, 0 for flat out
+    backlog: int = 0  # readings each probe replays before it starts
+    readers: int = 2
+    read_interval: float = 0.5  # seconds between a reader's requests
+    read_mix: dict = field(default_factory=lambda: dict(READ_MIX))
+    duration: float = 10.0
+
+
+def parse_mix(text: str) -> dict:
+    """ "read=4,latest=1" -> {"read": 4, "latest": 1} """
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in READ_MIX:
+            raise ValueError(f"unknown query {name!r}, expected one of {', '.join(READ_MIX)}")
+        mix[name] = float(weight) if weight else 1.0
+    return mix
+
+
+def percentile(latencies: list[float], p: float) -> float:
+    """Nearest rank percentile of a sorted list"""
+    return latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.readings = 0
+
+    def record(self, kind: str, seconds: float, ok: bool):
+        self.latencies.setdefault(kind, []).append(seconds)
+        if not ok:
+            self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    def summary(self, elapsed: float) -> dict:
+        result = {"elapsed": elapsed, "readings": self.readings, "readings_per_second": self.readings / elapsed}
+        for kind in sorted(self.latencies):
+            latencies = sorted(self.latencies[kind])
+            result[kind] = {
+                "requests": len(latencies),
+                "errors": self.errors.get(kind, 0),
+                "per_second": len(latencies) / elapsed,
+                "p50_ms": percentile(latencies, 50) * 1000,
+                "p95_ms": percentile(latencies, 95) * 1000,
+                "p99_ms": percentile(latencies, 99) * 1000,
+            }
+        return result
+
+
+async def timed(recorder: Recorder, kind: str, request) -> bool:
+    start = time.perf_counter()
+    try:
+        response = await request
+        ok = response.status_code < 400
+    except Exception:
+        ok = False
+    recorder.record(kind, time.perf_counter() - start, ok)
+    return ok
+
+
+async def probe(client, profile: LoadProfile, number: int, recorder: Recorder, stop: float):
+    sensors = [f"load_{number}_{s}" for s in range(profile.sensors)]
+    clock = int(time.time())
+
+    def batch(start):
+        return [
+            {"sensor": sensors[i % len(sensors)], "unit": "C",
+             "value": round(random.uniform(10, 30), 2), "recorded_timestamp": start + i}
+            for i in range(profile.batch)
+        ]
+
+    async def post(kind, readings):
+        if await timed(recorder, kind, client.post("/sense", json=readings)):
+            recorder.readings += len(readings)
+
+    # A backlog is sent as fast as possible and its first batch is sent
+    # twice, as happens when a probe didn't hear the first response.
+    backlog_start = clock - profile.backlog
+    for start in range(backlog_start, clock, profile.batch):
+        if time.monotonic() >= stop:
+            return
+        await post("sense_backlog", batch(start))
+        if start == backlog_start:
+            await post("sense_backlog", batch(start))
+
+    recorded = clock
+    while time.monotonic() < stop:
+        await post("sense", batch(recorded))
+        recorded += profile.batch
+        if profile.interval:
+            await asyncio.sleep(profile.interval)
+
+
+async def reader(client, profile: LoadProfile, recorder: Recorder, stop: float):
+    kinds = list(profile.read_mix)
+    weights = [profile.read_mix[k] for k in kinds]
+    while time.monotonic() < stop:
+        kind = random.choices(kinds, weights)[0]
+        now = int(time.time())
+        if kind == "read":
+            request = client.get("/read", params={"start_timestamp": now - 600, "period": 600, "limit": 100})
+        elif kind == "latest":
+            request = client.get("/latest")
+        elif kind == "aggregate":
+            request = client.get("/aggregate", params={"period": 86400, "bucket": "5m"})
+        else:
+            request = client.get("/read", params={"period": 86400, "max_points": 500})
+        await timed(recorder, kind, request)
+        if profile.read_interval:
+            await asyncio.sleep(profile.read_interval)
+
+
+async def run(client, profile: LoadProfile) -> dict:
+    """Run the load against an httpx.AsyncClient and summarise it"""
+    recorder = Recorder()
+    start = time.monotonic()
+    stop = start + profile.duration
+    await asyncio.gather(
+        *[probe(client, profile, n, recorder, stop) for n in range(profile.probes)],
+        *[reader(client, profile, recorder, stop) for _ in range(profile.readers)],
+    )
+    return {"profile": asdict(profile), "results": recorder.summary(time.monotonic() - start)}
+
+
+def compare(results: dict, baseline: dict) -> list[str]:
+    """Lines comparing the throughput and p99 of two runs"""
+    lines = []
+    new, old = results["results"], baseline["results"]
+    for kind in sorted(set(new) & set(old)):
+        if not isinstance(new[kind], dict):
+            continue
+        lines.append(
+            f"{kind:14} per_second {old[kind]['per_second']:8.1f} -> {new[kind]['per_second']:8.1f}"
+            f"   p99 {old[kind]['p99_ms']:8.1f} -> {new[kind]['p99_ms']:8.1f} ms"
+        )
+    return lines
@@ -10,12 +10,25 @@ See the LICENSE file in the current directory
 
 """
 
+import atexit
+import contextvars
 import logging
+import logging.handlers
+import queue
 import traceback
 from random import randint
 import os
 import sys
 
+LOGGER_NAME = "tmonitor_logger"
+FORMAT = "[%(filename)20s - %(funcName)25s - Line: %(lineno)4s] %(correlator)s %(levelname)s - %(message)s"
+
+# The correlator of the request being handled. The middleware sets it
+# and it follows the request into the threadpool.
+correlator_var = contextvars.ContextVar("correlator", default="-")
+
+_listener = None
+
 
 def generate_correlation_id():
     """
@@ -26,45 +39,86 @@ def generate_correlation_id():
     return correlation_id
 
 
+class CorrelatorFilter(logging.Filter):
+    """Stamp records that don't have a correlator with the current one"""
+
+    def filter(self, record):
+        if not hasattr(record, "correlator"):
+            record.correlator = correlator_var.get()
+        return True
+
+
+def configure():
+    """
+    Set up the handlers, once. Log calls only put the record on a queue;
+    a listener thread does the formatting and writing to stderr so that
+    requests don't wait for journald.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    log = logging.getLogger(LOGGER_NAME)
+    log.setLevel(os.getenv("TMONITOR_LOG_LEVEL", "INFO"))
+
+    records = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(records)
+    queue_handler.addFilter(CorrelatorFilter())
+    log.addHandler(queue_handler)
+
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(FORMAT))
+    _listener = logging.handlers.QueueListener(records, handler)
+    _listener.start()
+    atexit.register(shutdown)
+
+
+def shutdown():
+    """Write out anything still queued and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
 class RequestLogger:
+    """
+    Logs with a correlator. Without an explicit one it uses the
+    correlator of the current request, so one RequestLogger can be
+    shared by everything. Messages can take %-style arguments which
+    are only formatted if the level is enabled.
+    """
+
     def __init__(self, correlator: str = None):
-        self.logger = logging.getLogger("tmonitor_logger")
-
-        # zap the existing handlers so we don't get duplicate logs
-        if self.logger.handlers:
-            for handler in self.logger.handlers:
-                self.logger.removeHandler(handler)
-
-        handler = logging.StreamHandler()
-        handler.setFormatter(
-            logging.Formatter(
-                "[%(filename)20s - %(funcName)25s - Line: %(lineno)4s] %(correlator)s %(levelname)s - %(message)s"
-            )
-        )
-        self.logger.addHandler(handler)
-        self.logger.setLevel(os.getenv("TMONITOR_LOG_LEVEL", "INFO"))
-        if correlator:
-            self.correlator = correlator
-        else:
-            self.correlator = generate_correlation_id()
+        configure()
+        self.logger = logging.getLogger(LOGGER_NAME)
+        self._correlator = correlator
+
+    @property
+    def correlator(self):
+        return self._correlator or correlator_var.get()
+
+    def is_debug(self) -> bool:
+        return self.logger.isEnabledFor(logging.DEBUG)
 
-    def debug(self, message):
-        self.logger.debug(message, extra={"correlator": self.correlator})
+    def debug(self, message, *args):
+        self.logger.debug(message, *args, extra={"correlator": self.correlator}, stacklevel=2)
 
-    def info(self, message):
-        self.logger.info(message, extra={"correlator": self.correlator})
+    def info(self, message, *args):
+        self.logger.info(message, *args, extra={"correlator": self.correlator}, stacklevel=2)
 
     def exception(self, message):
         trace_str = traceback.format_exc().replace("\n", "\\n")
         self.logger.error(
-            f"{message}: {trace_str}", extra={"correlator": self.correlator}
+            "%s: %s", message, trace_str, extra={"correlator": self.correlator}, stacklevel=2
         )
 
-    def critical(self, message):
-        self.logger.critical(message, extra={"correlator": self.correlator})
+    def critical(self, message, *args):
+        self.logger.critical(message, *args, extra={"correlator": self.correlator}, stacklevel=2)
 
 
 if __name__ == "__main__":
+    correlator_var.set(generate_correlation_id())
     r = RequestLogger()
 
     r.debug("some debugging messge")
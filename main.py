@@ -31,25 +31,135 @@ SOFTWARE.
 """
 
 import logger
+import columnar
+import ingest_buffer
+import database
+import database_executor as database_executor_module
+import metrics
+import response_cache as response_cache_module
+from request_encoding import GzipRequestMiddleware
+from commit_watcher import CommitWatcher
+from latest import LatestReadings
+from stream import ReadingBroadcaster, DROPPED
 import traceback
 
-from fastapi import FastAPI, Request, HTTPException
+from fastapi import FastAPI, Request, HTTPException, Query
 from fastapi.staticfiles import StaticFiles
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from sqlalchemy.exc import IntegrityError
 from sqlmodel import Session
 
-from sensor_reading import SensorReading, SensorReadingPayload
+from sensor_reading import SensorReading, SensorReadingPayload, BUCKETS, encode_cursor, decode_cursor
 
-from typing import List
+from contextlib import asynccontextmanager
+import asyncio
+from typing import List, Literal
+import json
+import os
 from http import HTTPStatus
 import time
 import sys
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Start the optional write-behind buffer and the database maintenance
+    thread once the engine exists and make sure the buffer is drained
+    before the process exits. Worker processes started by startup.py
+    create their own engine here, from TMONITOR_DB_URL.
+    """
+    if getattr(app.state, "engine", None) is None:
+        database.add_engine_to_app(app, os.getenv("TMONITOR_DB_URL", database.production_db))
+    latest_readings(app)
+    app.state.commit_watcher = None
+    if database.workers() > 1:
+        app.state.commit_watcher = CommitWatcher(app.state.engine, lambda rows: readings_committed(app, rows))
+        app.state.commit_watcher.start()
+    app.state.ingest_buffer = ingest_buffer.from_environment(
+        app.state.engine, on_commit=lambda rows: readings_written(app, rows)
+    )
+    maintenance = database.maintenance_from_environment(app.state.engine)
+    maintenance.start()
+    yield
+    if app.state.ingest_buffer is not None:
+        app.state.ingest_buffer.stop()
+        app.state.ingest_buffer = None
+    if app.state.commit_watcher is not None:
+        app.state.commit_watcher.stop()
+        app.state.commit_watcher = None
+    maintenance.stop()
+    database_executor(app).shutdown()
+    app.state.database_executor = None
+
+
+NDJSON = "application/x-ndjson"
+READING_KEYS = ("sensor", "unit", "value", "recorded_timestamp", "received_timestamp")
+
+
+app = FastAPI(lifespan=lifespan)
+app.state.broadcaster = ReadingBroadcaster()
+
+# Seconds between SSE comments that keep idle /stream connections open
+STREAM_KEEPALIVE = 15
+
+# A window of received time that ended longer ago than this can't get
+# new readings, even ones waiting in the write-behind buffer.
+IMMUTABLE_AFTER = 60
+
+
+def latest_readings(app: FastAPI) -> LatestReadings:
+    """
+    The in-memory latest reading per sensor, loaded from the
+    database the first time it's needed after the engine is set.
+    """
+    latest = getattr(app.state, "latest", None)
+    if latest is None or latest.engine is not app.state.engine:
+        latest = app.state.latest = LatestReadings(app.state.engine)
+    return latest
+
+
+def response_cache(app: FastAPI) -> response_cache_module.ResponseCache:
+    """ The cache of /read and /aggregate responses for the current engine """
+    cache = getattr(app.state, "response_cache", None)
+    if cache is None or cache.engine is not app.state.engine:
+        cache = app.state.response_cache = response_cache_module.from_environment(app.state.engine)
+    return cache
+
+
+def database_executor(app: FastAPI) -> database_executor_module.DatabaseExecutor:
+    """ The writer thread and reader threads of the async endpoints """
+    executor = getattr(app.state, "database_executor", None)
+    if executor is None:
+        executor = app.state.database_executor = database_executor_module.from_environment()
+    return executor
+
+
+def readings_written(app: FastAPI, rows):
+    """
+    Called with the rows inserted by /sense once they are committed,
+    directly or by the write-behind buffer. With several workers the
+    commit watcher passes on every worker's rows instead.
+    """
+    if getattr(app.state, "commit_watcher", None) is None:
+        readings_committed(app, rows)
+
+
+def readings_committed(app: FastAPI, rows):
+    """
+    Bring the latest readings, the response cache and /stream
+    subscribers up to date with newly committed rows.
+    """
+    if not rows:
+        return
+    latest_readings(app).update(rows)
+    received = [row[4] for row in rows]
+    recorded = [row[3] for row in rows]
+    response_cache(app).invalidate((min(received), max(received)), (min(recorded), max(recorded)))
+    if app.state.broadcaster.subscribers:
+        app.state.broadcaster.publish([dict(zip(READING_KEYS, row)) for row in rows])
 
 
 origins = [
@@ -69,6 +179,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(GzipRequestMiddleware)
 
 
 @app.middleware("http")
@@ -78,10 +189,25 @@ async def add_logger_with_correlator(request: Request, call_next):
     in the state. This lets everything following use the same
     correlation id and logging setup just by having access
     to the request. Saves repeating the same thing in each handler.
+    The correlation id is also put in the request's context so
+    that code without access to the request logs it too.
+    Every request is counted and timed for /metrics.
     """
-    request.state.logger = logger.RequestLogger()
-    request.state.correlator = request.state.logger.correlator
-    response = await call_next(request)
+    start = time.perf_counter()
+    correlator = logger.generate_correlation_id()
+    token = logger.correlator_var.set(correlator)
+    request.state.logger = logger.RequestLogger(correlator)
+    request.state.correlator = correlator
+    status = HTTPStatus.INTERNAL_SERVER_ERROR
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        logger.correlator_var.reset(token)
+        # The route's path, not the request's, so there's a fixed set of them
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        metrics.inc(metrics.HTTP_REQUESTS, (route, request.method, str(status)))
+        metrics.observe(metrics.HTTP_SECONDS, time.perf_counter() - start, (route, request.method))
     return response
 
 
@@ -120,47 +246,374 @@ def generic_exception_handler(request: Request, exc: Exception):
         headers={"X-Correlation-Id": request.state.correlator},
     )
 
+def busy_response(request: Request, retry_after: int):
+    response = {
+        "id": request.state.correlator,
+        "description": "Busy, retry later",
+        "description_key": "service.unavailable",
+    }
+    return JSONResponse(
+        response,
+        status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+        headers={"Retry-After": str(retry_after)},
+    )
+
+
+async def queue_readings(buffer, readings: List[SensorReadingPayload]):
+    """
+    Hand the readings to the write-behind buffer and wait for the flush
+    that commits them, so that a probe only hears its readings are
+    stored once they are. Returns the new ones.
+    """
+    future = buffer.submit(readings)
+    try:
+        return await asyncio.wrap_future(future)
+    except IntegrityError:
+        raise HTTPException(
+            HTTPStatus.UNPROCESSABLE_ENTITY, "Reading violates a database constraint"
+        )
+
+
+def write_readings(app: FastAPI, readings: List[SensorReadingPayload]):
+    """ Store readings, on the writer thread, and return the new ones """
+    with database.write_lock(app.state.engine), Session(app.state.engine) as session:
+        try:
+            inserted = SensorReading.ingest(session, readings)
+            database.commit(session)
+        except IntegrityError:
+            raise HTTPException(
+                HTTPStatus.UNPROCESSABLE_ENTITY, "Reading violates a database constraint"
+            )
+    readings_written(app, inserted)
+    return inserted
+
+
 @app.post("/sense", response_class=JSONResponse)
-def sensor_event(request: Request, readings: List[SensorReadingPayload]):
+async def sensor_event(request: Request, readings: List[SensorReadingPayload]):
     """
     Probes send sensor readings to this. The input is a list
     of SensorReadingPayloads in json.
+    Readings that have already been stored are counted as
+    duplicates and skipped so that probes can replay a backlog.
     It returns the current time so that probes without a clock
     battery can sync up.
     """
-    request.state.logger.debug(f"/sense {readings=}")
-    with Session(request.app.state.engine) as session:
-        try:
-            for reading in readings:
-                r = SensorReading.from_payload(reading)
-                session.add(r)
-            session.commit()
-        except IntegrityError:
-            raise HTTPError(409, "Possible duplicate")
+    request.state.logger.debug("/sense readings=%r", readings)
+    buffer = getattr(request.app.state, "ingest_buffer", None)
+    try:
+        if buffer is not None:
+            inserted = await queue_readings(buffer, readings)
+        else:
+            inserted = await database_executor(request.app).write(write_readings, request.app, readings)
+    except ingest_buffer.IngestBufferFull as e:
+        return busy_response(request, e.retry_after)
 
     response = {
         "id": request.state.correlator,
         "description": "ok",
         "description_key": "ok",
         "current_timestamp": int(time.time()),
+        "accepted": len(inserted),
+        "duplicates": len(readings) - len(inserted),
     }
     return JSONResponse(response, status_code=200)
 
 
+def ndjson_readings(engine, **window):
+    """
+    Yield the readings as newline delimited json, a batch at a time,
+    while they are read from the database.
+    """
+    with Session(engine) as session:
+        for rows in SensorReading.stream_readings(session, **window):
+            yield "".join(
+                json.dumps(dict(zip(READING_KEYS, row))) + "\n" for row in rows
+            ).encode("utf-8")
+
+
+def cached_response(request: Request, format: str, column: str, low: int, high: int, make):
+    """
+    Send the cached copy of this response if there is one, otherwise
+    make() it and cache it. low and high are the range of column the
+    response covers; new readings in that range drop it from the cache.
+    Windows of received time that are over are never going to change
+    so browsers may keep them too.
+    """
+    cache = response_cache(request.app)
+    key = cache.key(request.url.path, [*request.query_params.multi_items(), ("_format", format)])
+    if column == response_cache_module.RECEIVED and high < time.time() - IMMUTABLE_AFTER:
+        cache_control = "public, max-age=31536000, immutable"
+    else:
+        cache_control = "no-cache"
+
+    entry = cache.get(key)
+    if entry is not None:
+        return Response(
+            entry.body,
+            media_type=entry.media_type,
+            headers={"Cache-Control": cache_control, "X-Cache": "hit"},
+        )
+
+    generation = cache.generation
+    response = make()
+    if response.status_code == 200:
+        cache.put(key, response.body, response.media_type, column, low, high, generation)
+    response.headers["Cache-Control"] = cache_control
+    response.headers["X-Cache"] = "miss"
+    return response
+
+
 @app.get("/read", response_class=JSONResponse)
-def get_reading(
-        request: Request, start_timestamp: int = None, period: int = 600, limit=100
+async def get_reading(
+        request: Request,
+        start_timestamp: int = None,
+        period: int = 600,
+        limit: int = Query(100, ge=1),
+        sensor: List[str] = Query(None),
+        unit: List[str] = Query(None),
+        cursor: str = None,
+        max_points: int = Query(None, ge=2),
+        format: Literal["json", "ndjson", "columnar"] = None,
 ) -> list[SensorReading]:
     """
-    Returns a list of readings.
+    Returns a list of readings, optionally only for some sensors
+    or units (both can be repeated). If there are more than limit
+    readings in the window then next_cursor is set and passing it
+    back as cursor, with the same other parameters, fetches the
+    next page.
+    With max_points the whole window is returned in one go instead,
+    downsampled to at most max_points readings per sensor.
+    With format=ndjson (or Accept: application/x-ndjson) the whole
+    window is streamed as one json reading per line - for exports.
+    With format=columnar (or Accept: application/vnd.tmonitor.columnar)
+    the whole window is sent as packed arrays - see columnar.py.
+    Responses for a given start_timestamp are cached.
     """
+    if format is None:
+        accept = request.headers.get("accept", "")
+        if NDJSON in accept:
+            format = "ndjson"
+        elif columnar.MEDIA_TYPE in accept:
+            format = "columnar"
+        else:
+            format = "json"
+
+    executor = database_executor(request.app)
+    if format == "ndjson":
+        return StreamingResponse(
+            executor.iterate(
+                ndjson_readings(
+                    request.app.state.engine,
+                    start_timestamp=start_timestamp,
+                    period=period,
+                    sensors=sensor,
+                    units=unit,
+                )
+            ),
+            media_type=NDJSON,
+        )
+
+    after = None
+    if cursor is not None:
+        try:
+            after = decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(HTTPStatus.BAD_REQUEST, "Invalid cursor")
+
+    def make():
+        return read_response(
+            request, start_timestamp, period, limit, sensor, unit, after, max_points, format
+        )
+
+    if start_timestamp is None:
+        # Relative to now so it's different every time
+        return await executor.read(make)
+    return await executor.read(
+        cached_response,
+        request,
+        format,
+        response_cache_module.RECEIVED,
+        start_timestamp + 1,
+        start_timestamp + period,
+        make,
+    )
+
+
+def read_response(request, start_timestamp, period, limit, sensor, unit, after, max_points, format):
+    """ The body of /read for everything but the ndjson stream """
+    if format == "columnar":
+        with Session(request.app.state.engine) as session:
+            rows = SensorReading.stream_readings(
+                session, start_timestamp=start_timestamp, period=period, sensors=sensor, units=unit
+            )
+            body = columnar.encode(row for batch in rows for row in batch)
+        return Response(body, media_type=columnar.MEDIA_TYPE)
+
+    if max_points is not None:
+        with Session(request.app.state.engine) as session:
+            rlist = SensorReading.fetch_downsampled(
+                session,
+                start_timestamp=start_timestamp,
+                period=period,
+                max_points=max_points,
+                sensors=sensor,
+                units=unit,
+            )
+        response = {"readings": rlist, "current_timestamp": int(time.time()), "next_cursor": None}
+        return JSONResponse(response, status_code=200)
+
     rlist = []
     with Session(request.app.state.engine) as session:
         results = SensorReading.fetch_readings(
-                session, start_timestamp=start_timestamp, period=period, limit=limit
+                session,
+                start_timestamp=start_timestamp,
+                period=period,
+                limit=limit + 1,
+                sensors=sensor,
+                units=unit,
+                after=after,
         )
-        request.state.logger.debug(f"{results=}")
-        rlist = [r.model_dump() for r in results]
-        response = {"readings": rlist, "current_timestamp": int(time.time())}
+        request.state.logger.debug("results=%r", results)
+        next_cursor = None
+        if len(results) > limit:
+            results = results[:limit]
+            next_cursor = encode_cursor(results[-1])
+        rlist = [r._asdict() for r in results]
+        response = {
+            "readings": rlist,
+            "current_timestamp": int(time.time()),
+            "next_cursor": next_cursor,
+        }
+
+    return JSONResponse(response, status_code=200)
+
+
+@app.get("/aggregate", response_class=JSONResponse)
+def get_aggregate(
+        request: Request,
+        start_timestamp: int = None,
+        period: int = 86400,
+        bucket: Literal[tuple(BUCKETS)] = "5m",
+        sensor: List[str] = Query(None),
+        unit: List[str] = Query(None),
+):
+    """
+    Returns min/max/mean/count of each sensor's readings for
+    every bucket (1m, 5m, 1h or 1d) of recorded time in the
+    period. Much smaller than the raw readings for charts.
+    Responses for a given start_timestamp are cached.
+    """
+    def make():
+        with Session(request.app.state.engine) as session:
+            aggregates = SensorReading.fetch_aggregates(
+                session,
+                start_timestamp=start_timestamp,
+                period=period,
+                bucket=BUCKETS[bucket],
+                sensors=sensor,
+                units=unit,
+            )
+        response = {
+            "bucket": BUCKETS[bucket],
+            "aggregates": aggregates,
+            "current_timestamp": int(time.time()),
+        }
+        return JSONResponse(response, status_code=200)
+
+    if start_timestamp is None:
+        return make()
+    return cached_response(
+        request,
+        "json",
+        response_cache_module.RECORDED,
+        start_timestamp,
+        start_timestamp + period - 1,
+        make,
+    )
+
+
+@app.get("/latest", response_class=JSONResponse)
+def get_latest(request: Request):
+    """
+    The most recent reading of every sensor, from memory. Supports
+    If-None-Match so pollers get a 304 when nothing has changed.
+    """
+    etag, body = latest_readings(request.app).body()
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=HTTPStatus.NOT_MODIFIED, headers={"ETag": etag})
+    return Response(body, media_type="application/json", headers={"ETag": etag})
+
+
+@app.get("/stream")
+async def get_stream(request: Request, sensor: List[str] = Query(None)):
+    """
+    Server-Sent Events: a "readings" event with a json list of
+    readings each time new ones are committed, optionally only
+    for some sensors. A client that falls too far behind gets a
+    "dropped" event and the stream ends; it should reconnect and
+    fill any gap from /read.
+    """
+    broadcaster = request.app.state.broadcaster
+    subscription = broadcaster.subscribe(sensor)
+
+    async def events():
+        try:
+            yield ": connected\n\n"
+            while True:
+                try:
+                    batch = await asyncio.wait_for(subscription.queue.get(), STREAM_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if batch is DROPPED:
+                    yield "event: dropped\ndata: {}\n\n"
+                    return
+                yield f"event: readings\ndata: {json.dumps(batch)}\n\n"
+        finally:
+            broadcaster.unsubscribe(subscription)
+
+    return StreamingResponse(
+        events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"}
+    )
 
+
+@app.get("/stats", response_class=JSONResponse)
+def get_stats(request: Request):
+    """
+    Internal statistics, e.g. write-behind flush latency.
+    """
+    buffer = getattr(request.app.state, "ingest_buffer", None)
+    watcher = getattr(request.app.state, "commit_watcher", None)
+    broadcaster = request.app.state.broadcaster
+    response = {
+        "ingest_buffer": buffer.stats() if buffer is not None else None,
+        "response_cache": response_cache(request.app).stats(),
+        "database_executor": database_executor(request.app).stats(),
+        "commit_watcher": watcher.stats() if watcher is not None else None,
+        "stream": {
+            "subscribers": broadcaster.subscribers,
+            "published": broadcaster.published,
+            "dropped": broadcaster.dropped,
+        },
+        "current_timestamp": int(time.time()),
+    }
     return JSONResponse(response, status_code=200)
+
+
+@app.get("/metrics")
+def get_metrics(request: Request):
+    """
+    Counters and histograms in the Prometheus text format, plus how
+    long ago each sensor's newest reading was recorded. Only this
+    worker process's requests are counted.
+    """
+    now = time.time()
+    ages = {
+        (sensor,): round(now - reading["recorded_timestamp"], 3)
+        for sensor, reading in latest_readings(request.app).readings().items()
+    }
+    body = metrics.render(
+        [("tmonitor_newest_reading_age_seconds", "Seconds since the newest reading of each sensor was recorded",
+          ("sensor",), ages)]
+    )
+    return Response(body, media_type=metrics.CONTENT_TYPE)
@@ -0,0 +1,162 @@
+"""
+Counters and histograms for /metrics, in the Prometheus text format.
+
+Recording happens on every request and every batch of readings so it
+has to be cheap: each thread counts into a shard of its own, without
+taking a lock, and the shards are only added up when /metrics is
+scraped. A shard is a plain dict of (name, label values) to a number,
+or to a list of bucket counts and their sum for a histogram.
+
+Every worker process has its own counts.
+
+Copyright (c) 2025 Timothy Norman Murphy <tnmurphy@gmail.com>
+
+See the LICENSE file in the current directory
+"""
+
+from bisect import bisect_left
+from dataclasses import dataclass
+import threading
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Upper bounds of histogram buckets
+SECONDS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROWS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 50000)
+
+
+@dataclass(frozen=True)
+class Metric:
+    name: str
+    kind: str  # "counter" or "histogram"
+    help: str
+    labels: tuple = ()
+    buckets: tuple = None
+
+
+HTTP_REQUESTS = "tmonitor_http_requests_total"
+HTTP_SECONDS = "tmonitor_http_request_seconds"
+INGESTED = "tmonitor_readings_ingested_total"
+DUPLICATES = "tmonitor_readings_duplicate_total"
+BATCH_SIZE = "tmonitor_ingest_batch_size"
+COMMIT_SECONDS = "tmonitor_db_commit_seconds"
+QUERY_ROWS = "tmonitor_query_rows"
+
+METRICS = {
+    m.name: m
+    for m in [
+        Metric(HTTP_REQUESTS, "counter", "HTTP requests by route, method and status",
+               ("route", "method", "status")),
+        Metric(HTTP_SECONDS, "histogram", "Time until the response headers were ready",
+               ("route", "method"), SECONDS),
+        Metric(INGESTED, "counter", "Readings stored, by sensor", ("sensor",)),
+        Metric(DUPLICATES, "counter", "Readings skipped because they were already stored"),
+        Metric(BATCH_SIZE, "histogram", "Readings per batch given to SensorReading.ingest", buckets=ROWS),
+        Metric(COMMIT_SECONDS, "histogram", "Time taken to commit new readings", buckets=SECONDS),
+        Metric(QUERY_ROWS, "histogram", "Rows returned by each kind of query", ("query",), ROWS),
+    ]
+}
+
+_local = threading.local()
+_shards = []
+_shards_lock = threading.Lock()
+
+
+def _shard() -> dict:
+    try:
+        return _local.shard
+    except AttributeError:
+        shard = _local.shard = {}
+        with _shards_lock:
+            _shards.append(shard)
+        return shard
+
+
+def inc(name: str, labels: tuple = (), amount: float = 1):
+    shard = _shard()
+    key = (name, labels)
+    shard[key] = shard.get(key, 0) + amount
+
+
+def observe(name: str, value: float, labels: tuple = ()):
+    shard = _shard()
+    key = (name, labels)
+    counts = shard.get(key)
+    if counts is None:
+        buckets = METRICS[name].buckets
+        # A count per bucket, then +Inf, then the sum
+        counts = shard[key] = [0] * (len(buckets) + 2)
+    counts[bisect_left(METRICS[name].buckets, value)] += 1
+    counts[-1] += value
+
+
+def totals() -> dict:
+    """Every thread's shard added up"""
+    with _shards_lock:
+        shards = list(_shards)
+    result = {}
+    for shard in shards:
+        # copy() holds the GIL throughout so the owner can't resize it meanwhile
+        for key, value in shard.copy().items():
+            if isinstance(value, list):
+                total = result.get(key)
+                if total is None:
+                    result[key] = list(value)
+                else:
+                    result[key] = [a + b for a, b in zip(total, value)]
+            else:
+                result[key] = result.get(key, 0) + value
+    return result
+
+
+def reset():
+    """Forget every count, for tests"""
+    with _shards_lock:
+        for shard in _shards:
+            shard.clear()
+
+
+def _labels(names, values, extra: str = None) -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra is not None:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value) -> str:
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def render(gauges: list = ()) -> str:
+    """
+    The exposition text for every metric, followed by gauges: a list of
+    (name, help, label names, {label values: value}) worked out at
+    scrape time.
+    """
+    counts = totals()
+    lines = []
+    for metric in METRICS.values():
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        series = sorted((labels, value) for (name, labels), value in counts.items() if name == metric.name)
+        for labels, value in series:
+            if metric.kind != "histogram":
+                lines.append(f"{metric.name}{_labels(metric.labels, labels)} {_number(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip((*metric.buckets, "+Inf"), value):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{metric.name}_bucket{_labels(metric.labels, labels, le)} {cumulative}")
+            lines.append(f"{metric.name}_sum{_labels(metric.labels, labels)} {_number(value[-1])}")
+            lines.append(f"{metric.name}_count{_labels(metric.labels, labels)} {cumulative}")
+    for name, help, label_names, values in gauges:
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} gauge")
+        for labels, value in sorted(values.items()):
+            lines.append(f"{name}{_labels(label_names, labels)} {_number(value)}")
+    return "\n".join(lines) + "\n"
@@ -3,11 +3,16 @@ A test tool for sending and receiving data from the backend.
 """
 
 import argparse
+import asyncio
 import requests
 import json
+import os
+import subprocess
+import tempfile
 import time
 from datetime import datetime
 from sensor_reading import SensorReadingPayload
+import loadgen
 
 
 def send_data(url):
@@ -22,10 +27,17 @@ def send_data(url):
 def receive_data(url):
     period = 60*60
     st = int(time.time()) - period  # 1 hour back
-    response = requests.get(f"{url}/read?start_timestamp={st}&period={period}&limit=100")
-    print(f"headers={response.headers}")
-    print(f"status={response.status_code}")
-    response_json = response.json()['readings']
+    params = {"start_timestamp": st, "period": period, "limit": 100}
+    response_json = []
+    while True:
+        response = requests.get(f"{url}/read", params=params)
+        print(f"headers={response.headers}")
+        print(f"status={response.status_code}")
+        page = response.json()
+        response_json.extend(page['readings'])
+        if page.get('next_cursor') is None:
+            break
+        params['cursor'] = page['next_cursor']
     for j in response_json:
         recorded = datetime.fromtimestamp(j['recorded_timestamp'])
         j['recorded_time'] = recorded.isoformat()
@@ -37,24 +49,149 @@ def receive_data(url):
     print(f"readings={output}")
 
 
+def export_data(url, start, period, output):
+    """ Stream every reading in the period to a file, one json object per line """
+    params = {"start_timestamp": start, "period": period, "format": "ndjson"}
+    count = 0
+    with requests.get(f"{url}/read", params=params, stream=True) as response:
+        print(f"status={response.status_code}")
+        with open(output, "wb") as f:
+            for line in response.iter_lines():
+                f.write(line + b"\n")
+                count += 1
+    print(f"exported {count} readings to {output}")
+
+
+def git_commit():
+    """The commit being benchmarked, if there is one"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def bench_live(url, profile):
+    import httpx
+
+    async with httpx.AsyncClient(base_url=url, timeout=30) as client:
+        return await loadgen.run(client, profile)
+
+
+async def bench_in_process(profile):
+    """The app in this process, on a throwaway database, without any network"""
+    import httpx
+    import database
+    import main
+
+    with tempfile.TemporaryDirectory() as directory:
+        url = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+        database.make_database(url)
+        database.add_engine_to_app(main.app, url)
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://in-process") as client:
+            results = await loadgen.run(client, profile)
+        main.app.state.engine.dispose()
+    return results
+
+
+def bench(args):
+    profile = loadgen.LoadProfile(
+        probes=args.probes,
+        sensors=args.sensors,
+        batch=args.batch,
+        interval=args.interval,
+        backlog=args.backlog,
+        readers=args.readers,
+        read_interval=args.read_interval,
+        read_mix=loadgen.parse_mix(args.mix),
+        duration=args.duration,
+    )
+    if args.in_process:
+        results = asyncio.run(bench_in_process(profile))
+    else:
+        results = asyncio.run(bench_live(args.url, profile))
+    results["target"] = "in-process" if args.in_process else args.url
+    results["commit"] = git_commit()
+    results["timestamp"] = int(time.time())
+
+    summary = results["results"]
+    print(f"{summary['readings']} readings sent, {summary['readings_per_second']:.1f}/s")
+    for kind, r in summary.items():
+        if isinstance(r, dict):
+            print(
+                f"{kind:14} {r['requests']:7} requests {r['errors']:5} errors {r['per_second']:8.1f}/s"
+                f"  p50 {r['p50_ms']:8.1f}  p95 {r['p95_ms']:8.1f}  p99 {r['p99_ms']:8.1f} ms"
+            )
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"compared with {args.baseline} (commit {baseline.get('commit')}):")
+        for line in loadgen.compare(results, baseline):
+            print(line)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"results saved to {args.json}")
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Send or receive sensor data from API."
     )
     parser.add_argument(
         "operation",
-        choices=["send", "receive"],
-        help="Operation to perform: 'send' or 'receive'",
+        choices=["send", "receive", "export", "bench"],
+        help="Operation to perform: 'send', 'receive', 'export' or 'bench'",
     )
     parser.add_argument(
         "--url", default="http://127.0.0.1:5000", help="Base URL of the API"
     )
+    parser.add_argument(
+        "--start", type=int, default=0, help="export: start timestamp (default: the beginning)"
+    )
+    parser.add_argument(
+        "--period", type=int, default=None, help="export: seconds from start (default: up to now)"
+    )
+    parser.add_argument(
+        "--output", default="readings.ndjson", help="export: file to write"
+    )
+    bench_options = parser.add_argument_group("bench", "simulated probes and readers")
+    bench_options.add_argument("--probes", type=int, default=10, help="probes posting readings")
+    bench_options.add_argument("--sensors", type=int, default=4, help="sensors per probe")
+    bench_options.add_argument("--batch", type=int, default=4, help="readings per /sense request")
+    bench_options.add_argument(
+        "--interval", type=float, default=1.0, help="seconds between a probe's requests, 0 for flat out"
+    )
+    bench_options.add_argument(
+        "--backlog", type=int, default=0, help="readings each probe replays before it starts"
+    )
+    bench_options.add_argument("--readers", type=int, default=2, help="clients making queries")
+    bench_options.add_argument(
+        "--read-interval", type=float, default=0.5, help="seconds between a reader's queries"
+    )
+    bench_options.add_argument(
+        "--mix", default="read=4,latest=4,aggregate=1,downsample=1", help="relative frequency of each query"
+    )
+    bench_options.add_argument("--duration", type=float, default=10.0, help="seconds to run for")
+    bench_options.add_argument(
+        "--in-process", action="store_true", help="run the app in this process instead of using --url"
+    )
+    bench_options.add_argument("--json", help="save the results to this file")
+    bench_options.add_argument("--baseline", help="compare with results saved by an earlier run")
     args = parser.parse_args()
 
     if args.operation == "send":
         send_data(args.url)
     elif args.operation == "receive":
         receive_data(args.url)
+    elif args.operation == "export":
+        period = args.period if args.period is not None else int(time.time()) - args.start
+        export_data(args.url, args.start, period, args.output)
+    elif args.operation == "bench":
+        bench(args)
 
 
 if __name__ == "__main__":
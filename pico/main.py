@@ -17,6 +17,15 @@ import re
 import secrets
 import base64
 import gc
+from array import array
+
+# Readings kept while the back-end can't be reached, 10 days' worth at
+# one every 5 minutes. The oldest are dropped after that.
+PENDING_CAPACITY = 2880
+# Readings per POST. The body is built in a buffer of this many times
+# MAX_READING_BYTES, allocated once.
+UPLOAD_BATCH = 48
+MAX_READING_BYTES = 120
 
 
 def get_temp():
@@ -42,8 +51,17 @@ class Reading:
     def __init__(self, value: float, time_secs=None):
         self.value = value
         if time_secs is None:
-            self.time_secs = utime.time()
-        self.time_string, self.date_string = time_date(self.time_secs)
+            time_secs = utime.time()
+        self.time_secs = time_secs
+
+    # Only formatted when something shows them
+    @property
+    def time_string(self) -> str:
+        return time_date(self.time_secs)[0]
+
+    @property
+    def date_string(self) -> str:
+        return time_date(self.time_secs)[1]
 
     def __lt__(self, other):
         return self.value < other.value
@@ -56,11 +74,76 @@ class Reading:
         return cls(get_temp())
 
 
+class ReadingRing:
+    """
+    Readings waiting to be uploaded, oldest first, in arrays allocated
+    once so that the heap doesn't grow however long the back-end is
+    out of reach. When it's full the oldest reading is dropped.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.values = array("f", bytes(4 * capacity))
+        self.times = array("I", bytes(4 * capacity))
+        self.start = 0
+        self.count = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, value: float, time_secs: int):
+        if self.count == self.capacity:
+            self.start = (self.start + 1) % self.capacity
+            self.count -= 1
+            self.dropped += 1
+        i = (self.start + self.count) % self.capacity
+        self.values[i] = value
+        self.times[i] = time_secs
+        self.count += 1
+
+    def last_value(self):
+        if self.count == 0:
+            return None
+        return self.values[(self.start + self.count - 1) % self.capacity]
+
+    def drop_oldest(self, n: int):
+        n = min(n, self.count)
+        self.start = (self.start + n) % self.capacity
+        self.count -= n
+
+    def encode(self, buf: bytearray, prefix: bytes, limit: int) -> tuple:
+        """
+        Write the oldest readings, at most limit of them, into buf as a
+        json list, each one prefix followed by its value and timestamp.
+        Returns how many readings and how many bytes were written.
+        """
+        end = len(buf) - 1
+        buf[0] = ord("[")
+        pos = 1
+        n = 0
+        while n < min(limit, self.count):
+            i = (self.start + n) % self.capacity
+            tail = b'%.3f,"recorded_timestamp":%d}' % (self.values[i], self.times[i])
+            size = len(prefix) + len(tail) + (1 if n else 0)
+            if pos + size > end:
+                break
+            if n:
+                buf[pos] = ord(",")
+                pos += 1
+            buf[pos:pos + len(prefix)] = prefix
+            pos += len(prefix)
+            buf[pos:pos + len(tail)] = tail
+            pos += len(tail)
+            n += 1
+        buf[pos] = ord("]")
+        return n, pos + 1
+
+
 class TempStats:
     max_t: Reading = Reading(-1000)
     min_t: Reading = Reading(1000)
-    last_t: list[Reading] = [Reading(0)]
-    last_uploaded: bool = False
+    pending: ReadingRing = ReadingRing(PENDING_CAPACITY)
     dipped_t: Reading = Reading(0)
     threshold: float = 5.0
 
@@ -73,10 +156,10 @@ class TempStats:
         if cls.min_t > t:
             cls.min_t = t
 
-        if t.value < cls.threshold and cls.last_t[-1].value > cls.threshold:
+        last = cls.pending.last_value()
+        if t.value < cls.threshold and last is not None and last > cls.threshold:
             cls.dipped_t = t
-        cls.last_t.append(t)
-        cls.last_uploaded = False
+        cls.pending.append(t.value, t.time_secs)
 
 def read_battery_level():
     p = ADC(0)
@@ -117,19 +200,20 @@ async def monitor_temp(period_ms: int):
 
 
 async def uploader(led: Pin, post_period: int):
-    print(f"uploader: time {localtime}")
-    
     wlan = network.WLAN(network.STA_IF)
     time_re = re.compile('"current_timestamp" *: *([0-9]+)')
     machine_id = base64.urlsafe_b64encode(unique_id()).decode("utf-8")[:-1]
     print(f"Machine ID: {machine_id}")
     rtc = RTC()
+    prefix = ('{"sensor":"%s_temp","unit":"C","value":' % machine_id).encode("utf-8")
+    body = bytearray(UPLOAD_BATCH * MAX_READING_BYTES)
+    pending = TempStats.pending
 
     while True:
         localtime = utime.time()
         print(f"uploader: activating at {localtime}")
-        print(f"uploader: last set of stats uploaded: {TempStats.last_uploaded}")
-        if not TempStats.last_uploaded:
+        print(f"uploader: readings waiting: {len(pending)}, dropped so far: {pending.dropped}")
+        if len(pending):
             try:
                 ip = await connect(wlan)
                 if ip is None:
@@ -138,33 +222,26 @@ async def uploader(led: Pin, post_period: int):
                 print(f"uploader: connected to lan as {ip=}")
                 print(f"uploader: time {localtime}")
 
-                response_list = []
-                for last_t in TempStats.last_t:
-                    rj = """{
-                    "sensor": "%s",
-                    "unit": "C",
-                    "value": %f,
-                    "recorded_timestamp": %d
-                     }""" % (
-                        machine_id + "_temp",
-                        last_t.value,
-                        int(last_t.time_secs),
+                while len(pending):
+                    count, size = pending.encode(body, prefix, UPLOAD_BATCH)
+                    if count == 0:
+                        # Can't happen unless MAX_READING_BYTES is too small
+                        raise Exception("reading too big for the upload buffer")
+                    print(f"uploader: sending {count} readings")
+                    response = requests.post(
+                        secrets.backend_url + "/sense", data=memoryview(body)[:size]
                     )
-                    response_list.append(rj)
-                response_body = "[" + ",".join(response_list) + "]"
-                print(f"uploader: sending {response_body}")
-                response = requests.post(
-                    secrets.backend_url + "/sense", data=response_body
-                )
-                print(f"uploader: response: {response.status_code}")
-
-                if response.status_code == 200:
-                    TempStats.last_uploaded = True
-                    TempStats.last_t = []
-                    if m := time_re.match(response.text):
+                    print(f"uploader: response: {response.status_code}")
+                    if response.status_code != 200:
+                        response.close()
+                        break
+
+                    # Readings taken while this was sent stay for next time
+                    pending.drop_oldest(count)
+                    if m := time_re.search(response.text):
                         # Set the local clock to match the remote one.
 
-                        servertime = int(m.groups()[1])
+                        servertime = int(m.group(1))
                         time_delta = localtime - servertime
 
                         # don't set the time repeatedly, only
@@ -173,6 +250,7 @@ async def uploader(led: Pin, post_period: int):
                             dt = datetime.fromtimestamp(servertime)
                             print(f"uploader: correcting time to {dt}")
                             rtc.datetime(dt.timetuple())
+                    response.close()
                 # await asyncio.sleep_ms(1000)
                 blink(led, 4)
                 print("uploader: disconnecting")
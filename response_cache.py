@@ -0,0 +1,128 @@
+"""
+A bounded cache of encoded /read and /aggregate responses.
+
+A window of readings that's already over doesn't change unless more
+readings arrive for it, so the encoded response can be kept and sent
+again. Each entry remembers which range of received_timestamp or
+recorded_timestamp it covers and committing new readings drops only
+the entries whose range they fall into. The least recently used
+entries are dropped when the cache is bigger than max_bytes.
+
+Copyright (c) 2025 Timothy Norman Murphy <tnmurphy@gmail.com>
+
+See the LICENSE file in the current directory
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass
+import os
+import threading
+import time
+
+RECEIVED = "received_timestamp"
+RECORDED = "recorded_timestamp"
+
+
+@dataclass
+class CachedResponse:
+    body: bytes
+    media_type: str
+    column: str  # RECEIVED or RECORDED
+    low: int  # the range of column that the response covers, inclusive
+    high: int
+    expires: float
+
+
+class ResponseCache:
+    def __init__(self, engine, max_bytes: int = 16 * 1024 * 1024, ttl: float = 3600):
+        self.engine = engine
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        # Bumped by every invalidation so that a response computed while
+        # readings were being committed isn't stored afterwards.
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+        self.evicted = 0
+
+    @staticmethod
+    def key(path: str, params) -> tuple:
+        """Parameters in any order, or repeated, give the same key"""
+        return (path, tuple(sorted(params)))
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires < time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, body: bytes, media_type: str, column: str, low: int, high: int, generation: int):
+        """
+        Store a response unless readings were committed since generation
+        was read, or it's too big to be worth keeping.
+        """
+        if len(body) > self.max_bytes // 4:
+            return
+        entry = CachedResponse(body, media_type, column, low, high, time.monotonic() + self.ttl)
+        with self._lock:
+            if generation != self.generation:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._bytes += len(body)
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evicted += 1
+
+    def invalidate(self, received: tuple, recorded: tuple):
+        """
+        Drop entries overlapping the (low, high) ranges of received and
+        recorded timestamps of newly committed readings.
+        """
+        ranges = {RECEIVED: received, RECORDED: recorded}
+        with self._lock:
+            self.generation += 1
+            stale = [
+                key
+                for key, entry in self._entries.items()
+                if entry.low <= ranges[entry.column][1] and ranges[entry.column][0] <= entry.high
+            ]
+            for key in stale:
+                self._remove(key)
+            self.invalidated += len(stale)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= len(entry.body)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidated": self.invalidated,
+                "evicted": self.evicted,
+            }
+
+
+def from_environment(engine) -> ResponseCache:
+    return ResponseCache(
+        engine,
+        max_bytes=int(float(os.getenv("TMONITOR_CACHE_MB", "16")) * 1024 * 1024),
+        ttl=float(os.getenv("TMONITOR_CACHE_TTL", "3600")),
+    )
@@ -2,22 +2,141 @@
 Models and database for sensor readings
 """
 
-from sqlmodel import Field, Session, SQLModel, create_engine, select, DateTime, Enum
+from sqlmodel import Field, Session, SQLModel, create_engine, select, func, DateTime, Enum
+from sqlalchemy import Index, MetaData, Table, literal, text, tuple_, union_all
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.schema import CreateIndex, CreateTable
 from pydantic import BaseModel
+from downsample import MinMaxDecimator
+import metrics
+from collections import Counter
 from datetime import datetime, timezone
+from functools import lru_cache
+from typing import ClassVar
+import base64
+import json
 import time
 
 # engine = create_engine("sqlite:///:memory:")
 
 
+# Bucket sizes, in seconds, that /aggregate understands
+BUCKETS = {"1m": 60, "5m": 5 * 60, "1h": 60 * 60, "1d": 24 * 60 * 60}
+
+
+def encode_cursor(reading) -> str:
+    """
+    An opaque token for the position just after this reading in
+    (received_timestamp, sensor, recorded_timestamp) order. The
+    recorded_timestamp is needed because a whole backlog shares
+    one received_timestamp.
+    """
+    key = [reading.received_timestamp, reading.sensor, reading.recorded_timestamp]
+    return base64.urlsafe_b64encode(json.dumps(key).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """Raises ValueError if the cursor didn't come from encode_cursor()"""
+    try:
+        received, sensor, recorded = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (TypeError, ValueError, UnicodeError) as e:
+        raise ValueError(f"invalid cursor {cursor!r}") from e
+    if not (isinstance(received, int) and isinstance(sensor, str) and isinstance(recorded, int)):
+        raise ValueError(f"invalid cursor {cursor!r}")
+    return received, sensor, recorded
+
+
+# Readings are stored in one table per calendar month (UTC) of
+# recorded_timestamp, e.g. sensorreading_202510, so that old readings
+# can be dropped a whole month at a time. Partitioning on the recorded
+# time keeps duplicate detection exact: a reading's (sensor,
+# recorded_timestamp) can only ever be in one partition. A month
+# always starts at midnight so no /aggregate bucket spans two of them.
+PARTITION_PREFIX = "sensorreading_"
+PARTITION_GLOB = PARTITION_PREFIX + "[0-9][0-9][0-9][0-9][0-9][0-9]"
+
+# Partition tables aren't part of SQLModel.metadata so create_all()
+# doesn't know about them - they're created as readings arrive.
+partition_metadata = MetaData()
+
+
+@lru_cache(maxsize=4096)
+def _month_of_day(day: int) -> tuple[int, int]:
+    t = datetime.fromtimestamp(day * 86400, timezone.utc)
+    return t.year, t.month
+
+
+def partition_name(timestamp: int) -> str:
+    """The partition that a reading recorded at timestamp belongs in"""
+    year, month = _month_of_day(timestamp // 86400)
+    return f"{PARTITION_PREFIX}{year:04d}{month:02d}"
+
+
+def partition_range(name: str) -> tuple[int, int]:
+    """The [start, end) of recorded_timestamp that a partition holds"""
+    year, month = int(name[-6:-2]), int(name[-2:])
+    start = datetime(year, month, 1, tzinfo=timezone.utc)
+    end = datetime(year + month // 12, month % 12 + 1, 1, tzinfo=timezone.utc)
+    return int(start.timestamp()), int(end.timestamp())
+
+
+def partition_table(name: str) -> Table:
+    """A partition has the same columns and indexes as SensorReading"""
+    table = partition_metadata.tables.get(name)
+    if table is None:
+        table = SensorReading.__table__.to_metadata(partition_metadata, name=name)
+        for index in table.indexes:
+            # Index names are global to the database
+            index.name = index.name.replace("ix_sensorreading_", f"ix_{name}_", 1)
+    return table
+
+
+def partition_names(session: Session) -> list[str]:
+    """The partitions that exist, oldest first"""
+    names = session.execute(
+        text("SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB :glob"),
+        {"glob": PARTITION_GLOB},
+    ).scalars()
+    return sorted(names)
+
+
+def create_partition(session: Session, name: str) -> Table:
+    table = partition_table(name)
+    connection = session.connection()
+    connection.execute(CreateTable(table, if_not_exists=True))
+    for index in table.indexes:
+        connection.execute(CreateIndex(index, if_not_exists=True))
+    return table
+
+
+# Recorded timestamps have to fall in a month that a partition can be
+# named after, so before the year 10000.
+MAX_TIMESTAMP = 253402300800
+
+
 class SensorReadingPayload(BaseModel):
     sensor: str = Field(index=True, default=None)
     unit: str = Field(default=None)
     value: float = Field(default=None)
-    recorded_timestamp: int = Field(default=None)
+    recorded_timestamp: int = Field(ge=0, lt=MAX_TIMESTAMP)
 
 
 class SensorReading(SQLModel, table=True):
+    # This table is the template for the monthly partitions. Readings
+    # stored before there were partitions stay in it until database.py
+    # moves them and it's read as one more partition until then.
+    #
+    # The primary key already gives SQLite an index on (sensor, recorded_timestamp)
+    # which is what duplicate detection needs. Queries select and order by
+    # received_timestamp so they need an index that starts with it. The other
+    # columns make the order unique so a window can be read without a sort.
+    # Aggregates are over recorded_timestamp for any sensor, which the primary
+    # key can't help with unless the sensor is known.
+    __table_args__ = (
+        Index("ix_sensorreading_received", "received_timestamp", "sensor", "recorded_timestamp"),
+        Index("ix_sensorreading_recorded", "recorded_timestamp"),
+    )
+
     sensor: str = Field(index=True, default=None, primary_key=True)
     unit: str = Field(default=None)
     value: float = Field(default=None)
@@ -36,17 +155,560 @@ class SensorReading(SQLModel, table=True):
         )
 
     @classmethod
-    def fetch_readings(cls, session: Session, start_timestamp: int = None, period: int = 600, limit=100):
+    def ingest(cls, session: Session, payloads: list[SensorReadingPayload], received_timestamp: int = None):
+        """
+        Insert a batch of readings with one multi-row INSERT rather than
+        one ORM object per reading. Every reading in the batch shares the
+        same received_timestamp.
+
+        Readings that are already stored (same sensor and recorded_timestamp)
+        are skipped instead of failing the whole batch, so a probe can
+        safely replay a backlog. Returns the rows that were actually
+        inserted - the caller can work out the duplicates from that.
+        The caller is responsible for committing.
+        """
+        if received_timestamp is None:
+            received_timestamp = int(time.time())
+
+        rows = [
+            {
+                "sensor": p.sensor,
+                "unit": p.unit,
+                "value": p.value,
+                "recorded_timestamp": p.recorded_timestamp,
+                "received_timestamp": received_timestamp,
+            }
+            for p in payloads
+        ]
+        if not rows:
+            return []
+        metrics.observe(metrics.BATCH_SIZE, len(rows))
+
+        # Until database.py has moved them, older readings may still be
+        # in the unpartitioned table where the partitions' primary keys
+        # can't see them.
+        legacy = cls.__table__
+        new_rows = rows
+        if session.execute(select(literal(1)).select_from(legacy).limit(1)).first() is not None:
+            keys = tuple_(legacy.c.sensor, legacy.c.recorded_timestamp)
+            stored = set(
+                session.execute(
+                    select(legacy.c.sensor, legacy.c.recorded_timestamp).where(
+                        keys.in_([(row["sensor"], row["recorded_timestamp"]) for row in rows])
+                    )
+                ).all()
+            )
+            new_rows = [row for row in rows if (row["sensor"], row["recorded_timestamp"]) not in stored]
+
+        batches = {}
+        for row in new_rows:
+            name = partition_name(row["recorded_timestamp"])
+            batch = batches.get(name)
+            if batch is None:
+                batch = batches[name] = []
+            batch.append(row)
+
+        existing = set(partition_names(session))
+        inserted = []
+        for name, batch in batches.items():
+            if name in existing:
+                table = partition_table(name)
+            else:
+                table = create_partition(session, name)
+            stmt = insert(table).on_conflict_do_nothing().returning(*table.c)
+            inserted.extend(session.execute(stmt, batch).all())
+        for rollup in ROLLUPS.values():
+            rollup.add(session, inserted)
+
+        for sensor, count in Counter(row[0] for row in inserted).items():
+            metrics.inc(metrics.INGESTED, (sensor,), count)
+        if len(inserted) < len(rows):
+            metrics.inc(metrics.DUPLICATES, amount=len(rows) - len(inserted))
+        return inserted
+
+    @classmethod
+    def partitions(cls, session: Session, start_timestamp: int = None, end_timestamp: int = None) -> list[Table]:
+        """
+        The tables holding readings recorded in [start_timestamp,
+        end_timestamp), oldest first. The unpartitioned table is only
+        included while it still has readings in it, or when there are
+        no partitions so that queries still have a table to read.
+        """
+        tables = []
+        if session.execute(select(literal(1)).select_from(cls.__table__).limit(1)).first() is not None:
+            tables.append(cls.__table__)
+        for name in partition_names(session):
+            start, end = partition_range(name)
+            if (start_timestamp is None or end > start_timestamp) and (
+                end_timestamp is None or start < end_timestamp
+            ):
+                tables.append(partition_table(name))
+        return tables or [cls.__table__]
+
+    @staticmethod
+    def union(selects: list):
+        """One statement for the same select from each partition"""
+        if len(selects) == 1:
+            return selects[0]
+        return union_all(*selects)
+
+    @staticmethod
+    def reading_order(statement) -> list:
+        """(received_timestamp, sensor, recorded_timestamp) of a select or union"""
+        columns = statement.selected_columns
+        return [columns.received_timestamp, columns.sensor, columns.recorded_timestamp]
+
+    @classmethod
+    def filter_window(
+        cls,
+        sel,
+        start_timestamp: int = None,
+        period: int = 600,
+        sensors: list[str] = None,
+        units: list[str] = None,
+        after: tuple = None,
+        table: Table = None,
+    ):
+        """
+        Restrict a select from table (by default the unpartitioned one)
+        to readings received in the window, optionally only those after
+        a cursor position (see select_readings).
+        """
+        if start_timestamp is None:
+            start_timestamp = int(time.time()) - period
+        c = (cls.__table__ if table is None else table).c
+
+        key = tuple_(c.received_timestamp, c.sensor, c.recorded_timestamp)
+        if after is not None and after[0] > start_timestamp:
+            # The cursor is the lower bound. SQLite only seeks on one lower
+            # bound so the window start mustn't be repeated here.
+            sel = sel.where(key > tuple_(*after))
+        else:
+            sel = sel.where(c.received_timestamp > start_timestamp)
+        sel = sel.where(c.received_timestamp <= start_timestamp + period)
+
+        if sensors:
+            # "|| ''" stops SQLite choosing the sensor index over the
+            # received_timestamp one, which would mean sorting the window.
+            sel = sel.where((c.sensor + "").in_(sensors))
+        if units:
+            sel = sel.where(c.unit.in_(units))
+        return sel
+
+    @classmethod
+    def select_window(
+        cls,
+        tables: list[Table],
+        start_timestamp: int = None,
+        period: int = 600,
+        sensors: list[str] = None,
+        units: list[str] = None,
+        after: tuple = None,
+    ):
+        """Every column of the readings in the window from each of tables"""
+        if start_timestamp is None:
+            start_timestamp = int(time.time()) - period
+        return cls.union(
+            [
+                cls.filter_window(select(*t.c), start_timestamp, period, sensors, units, after, table=t)
+                for t in tables
+            ]
+        )
+
+    @classmethod
+    def select_readings(
+        cls,
+        start_timestamp: int = None,
+        period: int = 600,
+        limit=100,
+        sensors: list[str] = None,
+        units: list[str] = None,
+        after: tuple = None,
+        tables: list[Table] = None,
+    ):
+        """
+        Readings received in the window, oldest first. Pages are read by
+        passing the decoded cursor of the last reading seen as "after" -
+        that's a seek on the index however deep into the window it is.
+        With several tables SQLite merges the already ordered partitions.
+        """
+        if tables is None:
+            tables = [cls.__table__]
+        sel = cls.select_window(tables, start_timestamp, period, sensors=sensors, units=units, after=after)
+        return sel.order_by(*cls.reading_order(sel)).limit(limit)
+
+    @classmethod
+    def fetch_readings(
+        cls,
+        session: Session,
+        start_timestamp: int = None,
+        period: int = 600,
+        limit=100,
+        sensors: list[str] = None,
+        units: list[str] = None,
+        after: tuple = None,
+    ):
+        """
+        Readings as rows with the same attributes as SensorReading.
+        Building model objects costs twenty times as much as the query.
+        """
+        # A received window can hold readings recorded in any month
+        sel = cls.select_readings(
+            start_timestamp=start_timestamp,
+            period=period,
+            limit=limit,
+            sensors=sensors,
+            units=units,
+            after=after,
+            tables=cls.partitions(session),
+        )
+        rows = session.execute(sel).all()
+        metrics.observe(metrics.QUERY_ROWS, len(rows), ("fetch_readings",))
+        return rows
+
+    @classmethod
+    def stream_readings(
+        cls,
+        session: Session,
+        start_timestamp: int = None,
+        period: int = 600,
+        sensors: list[str] = None,
+        units: list[str] = None,
+        batch_size: int = 1000,
+    ):
+        """
+        Every reading in the window, oldest first, as lists of plain
+        (sensor, unit, value, recorded_timestamp, received_timestamp)
+        rows of at most batch_size. Rows are fetched from the cursor as
+        they're needed so memory doesn't depend on the size of the window.
+        """
+        sel = cls.select_window(cls.partitions(session), start_timestamp, period, sensors=sensors, units=units)
+        sel = sel.order_by(*cls.reading_order(sel)).execution_options(yield_per=batch_size)
+        count = 0
+        try:
+            for rows in session.execute(sel).partitions():
+                count += len(rows)
+                yield rows
+        finally:
+            metrics.observe(metrics.QUERY_ROWS, count, ("stream_readings",))
+
+    @classmethod
+    def fetch_downsampled(
+        cls,
+        session: Session,
+        start_timestamp: int = None,
+        period: int = 600,
+        max_points: int = 500,
+        sensors: list[str] = None,
+        units: list[str] = None,
+    ):
+        """
+        At most max_points readings per sensor from the window, chosen
+        by min/max decimation (see downsample.py). The window is read
+        twice: once through the index for each sensor's time range and
+        then row by row into the decimator.
+        """
         if start_timestamp is None:
             start_timestamp = int(time.time()) - period
 
-        sel = (
-            select(SensorReading)
-            .where(SensorReading.received_timestamp > start_timestamp)
-            .where(SensorReading.received_timestamp <= start_timestamp + period)
-            .order_by(SensorReading.received_timestamp)
-            .limit(limit)
+        tables = cls.partitions(session)
+        sensor_ranges = {}
+        for t in tables:
+            ranges = cls.filter_window(
+                select(t.c.sensor, func.min(t.c.recorded_timestamp), func.max(t.c.recorded_timestamp)),
+                start_timestamp,
+                period,
+                sensors=sensors,
+                units=units,
+                table=t,
+            ).group_by(t.c.sensor)
+            for sensor, first, last in session.execute(ranges):
+                if sensor in sensor_ranges:
+                    first = min(first, sensor_ranges[sensor][0])
+                    last = max(last, sensor_ranges[sensor][1])
+                sensor_ranges[sensor] = (first, last)
+        decimator = MinMaxDecimator(max_points, sensor_ranges)
+
+        rows = cls.select_window(
+            tables, start_timestamp, period, sensors=sensors, units=units
+        ).execution_options(yield_per=1000)
+        for row in session.execute(rows):
+            decimator.add(row)
+        readings = decimator.readings()
+        metrics.observe(metrics.QUERY_ROWS, len(readings), ("fetch_downsampled",))
+        return readings
+
+    @classmethod
+    def select_aggregates(
+        cls,
+        start_timestamp: int,
+        end_timestamp: int,
+        bucket: int,
+        sensors: list[str] = None,
+        units: list[str] = None,
+        tables: list[Table] = None,
+    ):
+        """
+        min/max/mean/count per sensor for each bucket-second slot of
+        recorded_timestamp in [start_timestamp, end_timestamp).
+        The grouping is done by SQLite, not in python.
+        """
+        if tables is None:
+            tables = [cls.__table__]
+
+        def buckets(t, mean):
+            bucket_start = ((t.c.recorded_timestamp // bucket) * bucket).label("bucket_start")
+            sel = (
+                select(
+                    t.c.sensor,
+                    t.c.unit,
+                    bucket_start,
+                    func.min(t.c.value).label("min"),
+                    func.max(t.c.value).label("max"),
+                    mean,
+                    func.count().label("count"),
+                )
+                .where(t.c.recorded_timestamp >= start_timestamp)
+                .where(t.c.recorded_timestamp < end_timestamp)
+            )
+            if sensors:
+                sel = sel.where(t.c.sensor.in_(sensors))
+            if units:
+                sel = sel.where(t.c.unit.in_(units))
+            return sel.group_by(t.c.sensor, t.c.unit, bucket_start)
+
+        if len(tables) == 1 or all(t is not cls.__table__ for t in tables):
+            # A bucket never spans two months so each is in one partition
+            sel = cls.union([buckets(t, func.avg(t.c.value).label("mean")) for t in tables])
+            columns = sel.selected_columns
+            return sel.order_by(columns.sensor, columns.unit, columns.bucket_start)
+
+        # Unpartitioned readings can fall in the same buckets as
+        # partitioned ones so the buckets have to be combined.
+        parts = union_all(*[buckets(t, func.sum(t.c.value).label("sum")) for t in tables]).subquery()
+        return (
+            select(
+                parts.c.sensor,
+                parts.c.unit,
+                parts.c.bucket_start,
+                func.min(parts.c.min).label("min"),
+                func.max(parts.c.max).label("max"),
+                (func.sum(parts.c.sum) / func.sum(parts.c.count)).label("mean"),
+                func.sum(parts.c.count).label("count"),
+            )
+            .group_by(parts.c.sensor, parts.c.unit, parts.c.bucket_start)
+            .order_by(parts.c.sensor, parts.c.unit, parts.c.bucket_start)
+        )
+
+    @classmethod
+    def fetch_aggregates(
+        cls,
+        session: Session,
+        start_timestamp: int = None,
+        period: int = 86400,
+        bucket: int = 300,
+        sensors: list[str] = None,
+        units: list[str] = None,
+    ):
+        """
+        Buckets that a rollup table covers completely are read from it.
+        Only the partial buckets at either end of the period come from
+        the raw readings.
+        """
+        if start_timestamp is None:
+            start_timestamp = int(time.time()) - period
+        end_timestamp = start_timestamp + period
+
+        def raw(start, end):
+            tables = cls.partitions(session, start, end)
+            sel = cls.select_aggregates(start, end, bucket, sensors=sensors, units=units, tables=tables)
+            return [row._asdict() for row in session.execute(sel)]
+
+        rollup = ROLLUPS.get(bucket)
+        first = -(-start_timestamp // bucket) * bucket
+        last = end_timestamp // bucket * bucket
+        if rollup is None or first >= last:
+            aggregates = raw(start_timestamp, end_timestamp)
+        else:
+            aggregates = rollup.fetch(session, first, last, sensors=sensors, units=units)
+            if start_timestamp < first:
+                aggregates.extend(raw(start_timestamp, first))
+            if last < end_timestamp:
+                aggregates.extend(raw(last, end_timestamp))
+            aggregates.sort(key=lambda a: (a["sensor"], a["unit"] or "", a["bucket_start"]))
+        metrics.observe(metrics.QUERY_ROWS, len(aggregates), ("fetch_aggregates",))
+        return aggregates
+
+    @classmethod
+    def fetch_latest(cls, session: Session, sensor: str):
+        """
+        The most recently recorded reading of a sensor or None. The
+        partitions are searched newest first, each with a seek on the
+        primary key.
+        """
+        def newest(t):
+            return session.execute(
+                select(*t.c).where(t.c.sensor == sensor).order_by(t.c.recorded_timestamp.desc()).limit(1)
+            ).first()
+
+        tables = cls.partitions(session)
+        found = []
+        if tables and tables[0] is cls.__table__:
+            found.append(newest(tables.pop(0)))
+        for t in reversed(tables):
+            row = newest(t)
+            if row is not None:
+                found.append(row)
+                break
+        found = [row for row in found if row is not None]
+        if not found:
+            return None
+        return cls(**max(found, key=lambda row: row.recorded_timestamp)._mapping)
+
+
+class Rollup(SQLModel):
+    """
+    Running min/max/sum/count of each sensor's readings per bucket of
+    recorded_timestamp. The tables are kept up to date by
+    SensorReading.ingest in the same transaction as the readings.
+    """
+
+    bucket: ClassVar[int]
+
+    sensor: str = Field(default=None, primary_key=True)
+    bucket_start: int = Field(default=None, primary_key=True)
+    unit: str = Field(default=None)
+    min: float = Field(default=None)
+    max: float = Field(default=None)
+    sum: float = Field(default=None)
+    count: int = Field(default=0)
+
+    @classmethod
+    def add(cls, session: Session, readings):
+        """
+        Fold newly inserted readings - SensorReading rows as returned by
+        SensorReading.ingest - into the rollup.
+        """
+        buckets = {}
+        size = cls.bucket
+        for sensor, unit, value, recorded_timestamp, _ in readings:
+            key = (sensor, recorded_timestamp // size * size)
+            b = buckets.get(key)
+            if b is None:
+                buckets[key] = [unit, value, value, value, 1]
+            else:
+                b[0] = unit
+                if value < b[1]:
+                    b[1] = value
+                if value > b[2]:
+                    b[2] = value
+                b[3] += value
+                b[4] += 1
+        if not buckets:
+            return
+
+        table = cls.__table__
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.sensor, table.c.bucket_start],
+            set_={
+                "unit": stmt.excluded.unit,
+                "min": func.min(table.c.min, stmt.excluded.min),
+                "max": func.max(table.c.max, stmt.excluded.max),
+                "sum": table.c.sum + stmt.excluded.sum,
+                "count": table.c.count + stmt.excluded.count,
+            },
         )
+        session.execute(
+            stmt,
+            [
+                {
+                    "sensor": sensor,
+                    "bucket_start": bucket_start,
+                    "unit": unit,
+                    "min": low,
+                    "max": high,
+                    "sum": total,
+                    "count": count,
+                }
+                for (sensor, bucket_start), (unit, low, high, total, count) in buckets.items()
+            ],
+        )
+
+    @classmethod
+    def fetch(cls, session: Session, start_timestamp: int, end_timestamp: int, sensors=None, units=None):
+        """Rows shaped like SensorReading.fetch_aggregates for buckets starting in [start, end)"""
+        sel = select(
+            cls.sensor,
+            cls.unit,
+            cls.bucket_start,
+            cls.min,
+            cls.max,
+            (cls.sum / cls.count).label("mean"),
+            cls.count,
+        ).where(cls.bucket_start >= start_timestamp, cls.bucket_start < end_timestamp)
+        if sensors:
+            sel = sel.where(cls.sensor.in_(sensors))
+        if units:
+            sel = sel.where(cls.unit.in_(units))
+        return [row._asdict() for row in session.execute(sel)]
+
+    @classmethod
+    def rebuild(cls, session: Session):
+        """
+        Recalculate the rollup from the raw readings. Buckets of readings
+        that have been dropped by the retention policy are kept.
+        """
+        tables = SensorReading.partitions(session)
+        firsts = [session.execute(select(func.min(t.c.recorded_timestamp))).scalar() for t in tables]
+        firsts = [first for first in firsts if first is not None]
+        if not firsts:
+            return
+
+        def buckets(t):
+            bucket_start = ((t.c.recorded_timestamp // cls.bucket) * cls.bucket).label("bucket_start")
+            return select(
+                t.c.sensor,
+                bucket_start,
+                func.max(t.c.unit).label("unit"),
+                func.min(t.c.value).label("min"),
+                func.max(t.c.value).label("max"),
+                func.sum(t.c.value).label("sum"),
+                func.count().label("count"),
+            ).group_by(t.c.sensor, bucket_start)
+
+        if len(tables) == 1 or all(t is not SensorReading.__table__ for t in tables):
+            sel = SensorReading.union([buckets(t) for t in tables])
+        else:
+            parts = union_all(*[buckets(t) for t in tables]).subquery()
+            sel = select(
+                parts.c.sensor,
+                parts.c.bucket_start,
+                func.max(parts.c.unit),
+                func.min(parts.c.min),
+                func.max(parts.c.max),
+                func.sum(parts.c.sum),
+                func.sum(parts.c.count),
+            ).group_by(parts.c.sensor, parts.c.bucket_start)
+        first = min(firsts)
+
+        table = cls.__table__
+        session.execute(table.delete().where(table.c.bucket_start >= first // cls.bucket * cls.bucket))
+        session.execute(
+            table.insert().from_select(
+                ["sensor", "bucket_start", "unit", "min", "max", "sum", "count"], sel
+            )
+        )
+
+
+class HourlyRollup(Rollup, table=True):
+    __tablename__ = "rollup_hourly"
+    bucket: ClassVar[int] = BUCKETS["1h"]
+
+
+class DailyRollup(Rollup, table=True):
+    __tablename__ = "rollup_daily"
+    bucket: ClassVar[int] = BUCKETS["1d"]
+
 
-        result = session.scalars(sel).all()
-        return result
+ROLLUPS = {rollup.bucket: rollup for rollup in (HourlyRollup, DailyRollup)}
@@ -1,9 +1,24 @@
+import argparse
+import os
+
 import uvicorn
 import database
 
 if __name__ == "__main__":
-    import main
+    parser = argparse.ArgumentParser(description="Run the back-end.")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.getenv("TMONITOR_WORKERS", "1")),
+        help="worker processes, e.g. one per core (default TMONITOR_WORKERS or 1)",
+    )
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    args = parser.parse_args()
 
-    database.add_engine_to_app(main.app, database.production_db)
+    # Each worker process creates its own engine when it starts up and
+    # needs to know whether it shares the database with others.
+    os.environ["TMONITOR_WORKERS"] = str(args.workers)
+    os.environ.setdefault("TMONITOR_DB_URL", database.production_db)
 
-    uvicorn.run("main:app", host="0.0.0.0", port=5000, log_level="info")
+    uvicorn.run("main:app", host=args.host, port=args.port, log_level="info", workers=args.workers)
@@ -0,0 +1,86 @@
+"""
+Fan out newly committed readings to /stream subscribers.
+
+Each subscriber has a small queue of its own. Publishing never waits:
+a subscriber that is too slow to keep its queue from filling up is
+dropped, and told so, rather than holding anything else up. Nothing
+here touches the database so open dashboards cost nothing while
+there's no new data.
+
+Copyright (c) 2025 Timothy Norman Murphy <tnmurphy@gmail.com>
+
+See the LICENSE file in the current directory
+"""
+
+import asyncio
+import threading
+
+# Put on a subscriber's queue, in place of a batch, when it's dropped
+DROPPED = None
+
+
+class Subscription:
+    def __init__(self, loop, sensors, queue_size: int):
+        self.loop = loop
+        self.sensors = set(sensors) if sensors else None
+        self.queue = asyncio.Queue(queue_size)
+        self.dropped = False
+
+
+class ReadingBroadcaster:
+    def __init__(self, queue_size: int = 64):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscriptions = set()
+        self.published = 0
+        self.dropped = 0
+
+    def subscribe(self, sensors: list[str] = None) -> Subscription:
+        """Must be called from the event loop that will read the queue"""
+        subscription = Subscription(asyncio.get_running_loop(), sensors, self.queue_size)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscriptions)
+
+    def publish(self, readings: list[dict]):
+        """
+        Send a batch of readings to every subscriber that wants any of
+        them. Safe to call from any thread.
+        """
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        self.published += 1
+        for subscription in subscriptions:
+            if subscription.sensors is None:
+                batch = readings
+            else:
+                batch = [r for r in readings if r["sensor"] in subscription.sensors]
+                if not batch:
+                    continue
+            try:
+                subscription.loop.call_soon_threadsafe(self._deliver, subscription, batch)
+            except RuntimeError:
+                # The subscriber's loop has closed
+                self.unsubscribe(subscription)
+
+    def _deliver(self, subscription: Subscription, batch: list[dict]):
+        if subscription.dropped:
+            return
+        try:
+            subscription.queue.put_nowait(batch)
+        except asyncio.QueueFull:
+            # Too slow. Throw away what it hasn't read and tell it why.
+            subscription.dropped = True
+            self.dropped += 1
+            self.unsubscribe(subscription)
+            while not subscription.queue.empty():
+                subscription.queue.get_nowait()
+            subscription.queue.put_nowait(DROPPED)
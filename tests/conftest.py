@@ -1,6 +1,7 @@
 """
    Test fixtures - common things for all tests.
 """
+import os
 import sys
 from pathlib import Path
 import pytest
@@ -20,3 +21,12 @@ def database_engine():
     database.new_test_database(main.app)
 
     return main.app.state.engine
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--benchmark-rows",
+        type=int,
+        default=int(os.getenv("TMONITOR_BENCHMARK_ROWS", "0")),
+        help="run the benchmarks in test_benchmark.py against a database of this many readings",
+    )
@@ -0,0 +1,189 @@
+"""
+Benchmarks of the data layer on a large synthetic database.
+
+Skipped unless a size is given, e.g.
+
+  python -m pytest tests/test_benchmark.py --benchmark-rows 1000000 -s
+
+The database is generated with INSERT ... SELECT from a recursive CTE,
+with the indexes built afterwards, and kept in pytest's cache directory
+so that later runs of the same size start straight away. Each case
+fails if it's slower than its entry in MIN_RATES, which are set at a
+fraction of what a desktop machine manages so that only large
+regressions fail the run.
+"""
+
+from pathlib import Path
+import json
+import sys
+import time
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.schema import CreateIndex, CreateTable
+from sqlmodel import Session, SQLModel
+
+# Add the project root directory to the sys path
+sys.path.append(str(Path(__file__).absolute().parents[1]))
+
+import columnar
+import database
+from sensor_reading import (
+    ROLLUPS,
+    SensorReading,
+    SensorReadingPayload,
+    partition_name,
+    partition_range,
+    partition_table,
+)
+
+SENSORS = 20
+STEP = 60  # seconds between readings of a sensor
+# The newest reading. Fixed so that a cached database stays the same.
+END = 1_760_000_400
+
+# Minimum rows, or readings, per second
+MIN_RATES = {
+    "ingest batch=10": 1_000,
+    "ingest batch=1000": 20_000,
+    "fetch_readings width=600": 20_000,
+    "fetch_readings width=3600": 50_000,
+    "fetch_readings width=86400": 100_000,
+    "serialize": 50_000,
+    "json": 100_000,
+    "columnar": 500_000,
+}
+
+
+def generate(engine, rows: int):
+    """
+    rows readings, SENSORS at a time every STEP seconds up to END,
+    written straight into the monthly partitions.
+    """
+    minutes = -(-rows // SENSORS)
+    first = END - (minutes - 1) * STEP
+    with engine.begin() as connection:
+        connection.execute(text("PRAGMA synchronous=OFF"))
+        start = first
+        while start <= END:
+            table = partition_table(partition_name(start))
+            end = min(partition_range(table.name)[1], END + STEP)
+            connection.execute(CreateTable(table))
+            connection.execute(
+                text(
+                    f"""
+                    WITH RECURSIVE n(i) AS (
+                        SELECT :low UNION ALL SELECT i + 1 FROM n WHERE i + 1 < :high
+                    )
+                    INSERT INTO "{table.name}"
+                        (sensor, unit, value, recorded_timestamp, received_timestamp)
+                    SELECT 'bench_' || (i % {SENSORS}), 'C', 15.0 + (i % 97) / 10.0,
+                           :first + (i / {SENSORS}) * {STEP}, :first + (i / {SENSORS}) * {STEP} + 5
+                    FROM n
+                    """
+                ),
+                {
+                    "low": (start - first) // STEP * SENSORS,
+                    "high": min(rows, (-(-(end - first) // STEP)) * SENSORS),
+                    "first": first,
+                },
+            )
+            for index in table.indexes:
+                connection.execute(CreateIndex(index))
+            start = partition_range(table.name)[1]
+    database.rebuild_rollups(engine)
+
+
+@pytest.fixture(scope="module")
+def large_database(request):
+    rows = request.config.getoption("--benchmark-rows")
+    if not rows:
+        pytest.skip("benchmarks need --benchmark-rows or TMONITOR_BENCHMARK_ROWS")
+
+    path = request.config.cache.mkdir("tmonitor-benchmark") / f"readings-{rows}.db"
+    url = f"sqlite:///{path}"
+    if not path.exists():
+        engine = database.create_engine(url)
+        SQLModel.metadata.create_all(engine)
+        start = time.perf_counter()
+        generate(engine, rows)
+        print(f"\ngenerated {rows} readings in {time.perf_counter() - start:.1f}s")
+        engine.dispose()
+    engine = database.create_engine(url)
+    yield engine
+    engine.dispose()
+
+
+def best_of(repeat: int, function, *args) -> float:
+    """The fastest of repeat runs, which is the least disturbed by anything else"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def check(name: str, count: int, seconds: float, record_property):
+    rate = count / seconds
+    print(f"\n{name:30} {count:9} in {seconds * 1000:9.1f} ms {rate:12.0f}/s")
+    record_property(name, rate)
+    assert rate >= MIN_RATES[name], f"{name} regressed to {rate:.0f}/s"
+
+
+class TestBenchmark:
+
+    @pytest.mark.parametrize("batch", [10, 1000])
+    def test_ingest(self, large_database, batch, record_property):
+        """ /sense batches on top of a large database, each committed """
+        batches = 200 if batch < 100 else 10
+        recorded = END + STEP
+        payloads = [
+            [
+                SensorReadingPayload(sensor=f"ingest_{i % SENSORS}", unit="C", value=1.0,
+                                     recorded_timestamp=recorded + b * batch + i)
+                for i in range(batch)
+            ]
+            for b in range(batches)
+        ]
+
+        def ingest():
+            try:
+                with Session(large_database) as session:
+                    for p in payloads:
+                        SensorReading.ingest(session, p, END + 10)
+                        session.commit()
+            finally:
+                # Leave the database as it was, for the next time too
+                with Session(large_database) as session:
+                    for table in [*SensorReading.partitions(session), *ROLLUPS.values()]:
+                        table = getattr(table, "__table__", table)
+                        session.execute(table.delete().where(table.c.sensor.like("ingest_%")))
+                    session.commit()
+
+        seconds = best_of(3, ingest)
+        check(f"ingest batch={batch}", batch * batches, seconds, record_property)
+
+    @pytest.mark.parametrize("width", [600, 3600, 86400])
+    def test_fetch_readings(self, large_database, width, record_property):
+        """ A window of received time, read in one go """
+        limit = width // STEP * SENSORS
+
+        def fetch():
+            with Session(large_database) as session:
+                readings = SensorReading.fetch_readings(session, start_timestamp=END - width, period=width, limit=limit)
+            assert len(readings) == limit
+
+        check(f"fetch_readings width={width}", limit, best_of(3, fetch), record_property)
+
+    def test_serialization(self, large_database, record_property):
+        """ Turning a day of readings into a /read response """
+        with Session(large_database) as session:
+            readings = SensorReading.fetch_readings(session, start_timestamp=END - 86400, period=86400, limit=10**9)
+            rows = [row for batch in SensorReading.stream_readings(session, start_timestamp=END - 86400,
+                                                                     period=86400) for row in batch]
+        dumped = [r._asdict() for r in readings]
+
+        check("serialize", len(readings), best_of(3, lambda: [r._asdict() for r in readings]), record_property)
+        check("json", len(dumped), best_of(3, lambda: json.dumps({"readings": dumped})), record_property)
+        check("columnar", len(rows), best_of(3, columnar.encode, rows), record_property)
@@ -0,0 +1,72 @@
+from fastapi.testclient import TestClient
+from pathlib import Path
+import sys
+import json
+import time
+
+# Add the project root directory to the sys path
+sys.path.append(str(Path(__file__).absolute().parents[1]))
+
+import main
+import columnar
+
+
+def rows(count, start=1_700_000_000):
+    return [
+        (f"probe_{i % 5}_temp", "C" if i % 5 else "%", 15.25 + (i % 40) / 8, start + i * 60, start + i * 60 + 2)
+        for i in range(count)
+    ]
+
+
+class TestColumnar:
+
+    client = TestClient(main.app)
+
+    def test_round_trip(self):
+        original = rows(1000)
+        decoded = columnar.decode(columnar.encode(original))
+        assert decoded["count"] == 1000
+        strings = decoded["strings"]
+        restored = list(zip(
+            (strings[i] for i in decoded["sensor"]),
+            (strings[i] for i in decoded["unit"]),
+            decoded["value"],
+            decoded["recorded_timestamp"],
+            decoded["received_timestamp"],
+        ))
+        assert restored == original
+
+    def test_empty(self):
+        decoded = columnar.decode(columnar.encode([]))
+        assert decoded["count"] == 0
+        assert len(decoded["value"]) == 0
+
+    def test_columns_aligned(self):
+        """ Every section is padded to 8 bytes so typed arrays can use it in place """
+        def pad(n):
+            return n + -n % 8
+
+        original = rows(7)
+        buffer = columnar.encode(original)
+        dictionary = sum(len(s.encode("utf-8")) + 1 for s in set(r[0] for r in original) | {"C", "%"})
+        assert len(buffer) == 24 + pad(dictionary) + 7 * 8 + 2 * pad(7 * 4) + 2 * pad(7 * 2)
+
+    def test_read_columnar(self, database_engine):
+        timestamp = int(time.time())
+        batch = [
+            {"sensor": f"col_{i % 5}", "unit": "C", "value": 20 + i / 100, "recorded_timestamp": timestamp - 2000 + i}
+            for i in range(1000)
+        ]
+        assert self.client.post("/sense", json=batch).status_code == 200
+        params = {"start_timestamp": timestamp - 60, "period": 120}
+
+        r = self.client.get("/read", params=params, headers={"Accept": columnar.MEDIA_TYPE})
+        assert r.status_code == 200
+        assert r.headers["content-type"] == columnar.MEDIA_TYPE
+        decoded = columnar.decode(r.content)
+        assert decoded["count"] == 1000
+        assert sorted(decoded["value"]) == sorted(x["value"] for x in batch)
+
+        as_json = self.client.get("/read", params={**params, "limit": 1000})
+        assert len(as_json.json()["readings"]) == 1000
+        assert len(as_json.content) / len(r.content) >= 5
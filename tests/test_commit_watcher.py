@@ -0,0 +1,56 @@
+from sqlmodel import Session, SQLModel
+from pathlib import Path
+import sys
+import time
+
+import pytest
+
+# Add the project root directory to the sys path
+sys.path.append(str(Path(__file__).absolute().parents[1]))
+
+import database
+from commit_watcher import CommitWatcher
+from sensor_reading import SensorReading, SensorReadingPayload
+
+
+def ingest(engine, sensor, recorded):
+    with database.write_lock(engine), Session(engine) as session:
+        SensorReading.ingest(session, [SensorReadingPayload(sensor=sensor, unit="C", value=1.0,
+                                                            recorded_timestamp=t) for t in recorded])
+        session.commit()
+
+
+@pytest.fixture
+def database_engine(tmp_path):
+    """ A database of its own so the write lock file goes in tmp_path too """
+    engine = database.create_engine(f"sqlite:///{tmp_path / 'watcher.db'}")
+    SQLModel.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+class TestCommitWatcher:
+
+    def test_poll(self, database_engine, monkeypatch):
+        """ Only rows committed since the last poll, in every partition """
+        monkeypatch.setenv("TMONITOR_WORKERS", "2")
+        assert isinstance(database.write_lock(database_engine), database.WriteLock)
+
+        now = int(time.time())
+        ingest(database_engine, "before", [now])
+        seen = []
+        watcher = CommitWatcher(database_engine, seen.extend, interval=0.01)
+        watcher.start()
+        try:
+            ingest(database_engine, "w", [now, now - 100 * 86400])
+            deadline = time.monotonic() + 5
+            while len(seen) < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+        finally:
+            watcher.stop()
+        assert sorted((row[0], row[3]) for row in seen) == [("w", now - 100 * 86400), ("w", now)]
+        assert watcher.poll() == []
+
+    def test_no_lock_for_one_worker(self, database_engine, monkeypatch):
+        monkeypatch.delenv("TMONITOR_WORKERS", raising=False)
+        assert not isinstance(database.write_lock(database_engine), database.WriteLock)
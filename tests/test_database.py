@@ -0,0 +1,54 @@
+from sqlalchemy import text
+from pathlib import Path
+import sys
+import time
+
+# Add the project root directory to the sys path
+sys.path.append(str(Path(__file__).absolute().parents[1]))
+
+import database
+
+
+def pragma(engine, name):
+    with engine.connect() as connection:
+        return connection.execute(text(f"PRAGMA {name}")).scalar()
+
+
+class TestDatabase:
+
+    def test_performance_profile(self, database_engine):
+        assert pragma(database_engine, "journal_mode") == "wal"
+        assert pragma(database_engine, "synchronous") == 1  # NORMAL
+        assert pragma(database_engine, "cache_size") == -8000
+        assert pragma(database_engine, "temp_store") == 2  # MEMORY
+        assert pragma(database_engine, "busy_timeout") == 5000
+        assert database_engine.pool.size() == database.pool_size()
+
+    def test_default_profile(self, tmp_path):
+        engine = database.create_engine(f"sqlite:///{tmp_path / 'default.db'}", "default")
+        assert pragma(engine, "journal_mode") == "delete"
+        assert pragma(engine, "synchronous") == 2  # FULL
+        engine.dispose()
+
+    def test_maintenance(self, database_engine):
+        maintenance = database.Maintenance(database_engine)
+        maintenance.checkpoint()
+        maintenance.optimize()
+
+    def test_maintenance_survives_errors(self, database_engine, monkeypatch):
+        maintenance = database.Maintenance(database_engine, checkpoint_seconds=0.01, retention_days=1)
+        checkpoints = []
+
+        def expire():
+            raise RuntimeError("database is locked")
+
+        monkeypatch.setattr(maintenance, "expire", expire)
+        monkeypatch.setattr(maintenance, "checkpoint", lambda: checkpoints.append(1))
+        maintenance.start()
+        try:
+            deadline = time.monotonic() + 5
+            while len(checkpoints) < 3 and time.monotonic() < deadline:
+                time.sleep(0.01)
+        finally:
+            maintenance.stop()
+        assert len(checkpoints) >= 3
@@ -0,0 +1,50 @@
+from pathlib import Path
+import asyncio
+import sys
+import threading
+
+# Add the project root directory to the sys path
+sys.path.append(str(Path(__file__).absolute().parents[1]))
+
+import logger
+from database_executor import DatabaseExecutor
+
+
+class TestDatabaseExecutor:
+
+    def test_writes_not_held_up_by_reads(self):
+        """ Every reader thread being busy doesn't delay the writer """
+        executor = DatabaseExecutor(readers=2)
+        release = threading.Event()
+
+        async def run():
+            reads = [asyncio.ensure_future(executor.read(release.wait, 5)) for _ in range(4)]
+            await asyncio.sleep(0.05)
+            written = await asyncio.wait_for(executor.write(threading.current_thread), 1)
+            assert not any(read.done() for read in reads)
+            release.set()
+            await asyncio.gather(*reads)
+            return written
+
+        try:
+            assert asyncio.run(run()).name.startswith("db_writer")
+        finally:
+            executor.shutdown()
+
+    def test_context_and_iterate(self):
+        """ The correlator follows the work to the threads """
+        executor = DatabaseExecutor()
+
+        def correlated(n):
+            for i in range(n):
+                yield (logger.correlator_var.get(), i)
+
+        async def run():
+            logger.correlator_var.set("abc")
+            assert await executor.read(logger.correlator_var.get) == "abc"
+            return [item async for item in executor.iterate(correlated(3))]
+
+        try:
+            assert asyncio.run(run()) == [("abc", 0), ("abc", 1), ("abc", 2)]
+        finally:
+            executor.shutdown()
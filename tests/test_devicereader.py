@@ -0,0 +1,47 @@
+from pathlib import Path
+import asyncio
+import sys
+
+import pytest
+
+# Add the linux probe's directory to the sys path
+sys.path.append(str(Path(__file__).absolute().parents[1] / "linux"))
+
+from devicereader import create_reader, reader_class
+from sensorhub import SensorHubReader
+from synthetic import SyntheticReader
+
+
+class TestDeviceReader:
+
+    def test_reader_classes(self):
+        assert reader_class("sensorhub") is SensorHubReader
+        assert reader_class("synthetic") is SyntheticReader
+        assert reader_class("synthetic:SyntheticReader") is SyntheticReader
+        with pytest.raises(ValueError):
+            reader_class("no_such_reader")
+
+    def test_create_reader(self):
+        reader = create_reader({"type": "synthetic", "count": 3, "prefix": "s", "interval": 0.5, "timeout": 0.1})
+        assert isinstance(reader, SyntheticReader)
+        assert reader.sensors == ["s_0", "s_1", "s_2"]
+        assert (reader.interval, reader.timeout) == (0.5, 0.1)
+        assert create_reader({"type": "synthetic"}).interval is None
+
+    def test_synthetic_timestamps_never_repeat(self):
+        reader = SyntheticReader(count=2)
+
+        async def read(times):
+            return [await reader.read() for _ in range(times)]
+
+        batches = asyncio.run(read(50))
+        assert all(len(batch) == 2 for batch in batches)
+        timestamps = [batch[0]["recorded_timestamp"] for batch in batches]
+        assert timestamps == sorted(set(timestamps))
+
+    @pytest.mark.parametrize("pattern", ["sine", "random_walk", "square", "constant"])
+    def test_synthetic_patterns(self, pattern):
+        reader = SyntheticReader(count=3, pattern=pattern, base=10.0, amplitude=2.0, period=60)
+        values = [reader.value(i, t) for t in range(0, 120, 7) for i in range(3)]
+        assert all(8.0 <= v <= 12.0 for v in values)
+        assert (len(set(values)) == 1) == (pattern == "constant")
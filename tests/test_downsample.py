@@ -0,0 +1,51 @@
+from pathlib import Path
+import sys
+import math
+import random
+
+# Add the project root directory to the sys path
+sys.path.append(str(Path(__file__).absolute().parents[1]))
+
+from downsample import MinMaxDecimator
+
+
+def wave(sensor, count, start=0, step=60):
+    return [
+        (sensor, "C", round(10 * math.sin(i / 50) + random.random(), 3), start + i * step, start + count * step)
+        for i in range(count)
+    ]
+
+
+class TestMinMaxDecimator:
+
+    def test_bounded_and_keeps_extremes(self):
+        rows = wave("a", 10000) + wave("b", 300, start=1000)
+        decimator = MinMaxDecimator(200, {"a": (0, 9999 * 60), "b": (1000, 1000 + 299 * 60)})
+        shuffled = rows[:]
+        random.shuffle(shuffled)
+        for row in shuffled:
+            decimator.add(row)
+        readings = decimator.readings()
+
+        a = [r for r in readings if r["sensor"] == "a"]
+        b = [r for r in readings if r["sensor"] == "b"]
+        assert len(a) <= 200
+        assert len(b) <= 200
+        assert [r["recorded_timestamp"] for r in a] == sorted(r["recorded_timestamp"] for r in a)
+        values = [r[2] for r in rows if r[0] == "a"]
+        assert min(r["value"] for r in a) == min(values)
+        assert max(r["value"] for r in a) == max(values)
+
+    def test_few_points_kept_as_is(self):
+        rows = wave("a", 5)
+        decimator = MinMaxDecimator(100, {"a": (0, 4 * 60)})
+        for row in rows:
+            decimator.add(row)
+        assert [r["recorded_timestamp"] for r in decimator.readings()] == [r[3] for r in rows]
+
+    def test_readings_outside_ranges(self):
+        """ Readings committed after the ranges were read don't break it """
+        decimator = MinMaxDecimator(4, {"a": (100, 200)})
+        for row in [("a", "C", 1.0, 50, 0), ("a", "C", 2.0, 150, 0), ("a", "C", 3.0, 250, 0), ("new", "C", 4.0, 150, 0)]:
+            decimator.add(row)
+        assert [r["value"] for r in decimator.readings()] == [1.0, 2.0, 3.0]
@@ -0,0 +1,124 @@
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+import pytest
+from pathlib import Path
+import sys
+import time
+
+# Add the project root directory to the sys path
+sys.path.append(str(Path(__file__).absolute().parents[1]))
+
+import main
+from ingest_buffer import IngestBuffer, IngestBufferFull
+from sensor_reading import SensorReading, SensorReadingPayload
+
+
+def payloads(count, sensor="test_buffer", start=None):
+    start = int(time.time()) if start is None else start
+    return [
+        SensorReadingPayload(sensor=sensor, unit="C", value=float(i), recorded_timestamp=start + i)
+        for i in range(count)
+    ]
+
+
+def stored(engine, sensor="test_buffer"):
+    with Session(engine) as session:
+        return [
+            row
+            for t in SensorReading.partitions(session)
+            for row in session.execute(select(t).where(t.c.sensor == sensor))
+        ]
+
+
+class TestIngestBuffer:
+
+    client = TestClient(main.app)
+
+    def test_flush_on_rows(self, database_engine):
+        """ Reaching flush_rows writes without waiting for the timer. """
+        buffer = IngestBuffer(database_engine, flush_ms=60000, flush_rows=10)
+        buffer.start()
+        try:
+            buffer.submit(payloads(10))
+            deadline = time.monotonic() + 5
+            while buffer.stats()["flushes"] == 0 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert len(stored(database_engine)) == 10
+        finally:
+            buffer.stop()
+
+    def test_drain_on_stop(self, database_engine):
+        """ Whatever is queued at shutdown is written in one flush. """
+        committed = []
+        buffer = IngestBuffer(database_engine, flush_ms=60000, flush_rows=1000, on_commit=committed.extend)
+        buffer.start()
+        start = int(time.time())
+        first = buffer.submit(payloads(3, start=start))
+        second = buffer.submit(payloads(5, start=start))
+        assert not first.done()
+        buffer.stop()
+        assert len(first.result()) == 3
+        assert len(second.result()) == 2
+
+        stats = buffer.stats()
+        assert stats["flushes"] == 1
+        assert stats["rows_flushed"] == 5
+        assert stats["duplicates"] == 3
+        assert len(stored(database_engine)) == 5
+        assert len(committed) == 5
+
+    def test_backpressure(self, database_engine):
+        """ A full buffer turns /sense away with a 503 and Retry-After. """
+        buffer = IngestBuffer(database_engine, flush_ms=2500, max_pending_rows=5)
+        buffer.submit(payloads(5))
+        with pytest.raises(IngestBufferFull):
+            buffer.submit(payloads(1))
+
+        main.app.state.ingest_buffer = buffer
+        try:
+            batch = [p.model_dump() for p in payloads(1, sensor="test_buffer_2")]
+            r = self.client.post("/sense", json=batch)
+            assert r.status_code == 503
+            assert r.headers["Retry-After"] == "3"
+            assert self.client.get("/stats").json()["ingest_buffer"]["rejected"] == 2
+        finally:
+            main.app.state.ingest_buffer = None
+            buffer.stop()
+        assert len(stored(database_engine)) == 5
+
+    def test_acknowledged_after_commit(self, database_engine):
+        """ /sense answers once the flush with its readings is committed """
+        buffer = IngestBuffer(database_engine, flush_ms=50)
+        buffer.start()
+        main.app.state.ingest_buffer = buffer
+        try:
+            batch = [p.model_dump() for p in payloads(4, sensor="test_buffer_3")]
+            r = self.client.post("/sense", json=batch)
+            assert r.status_code == 200
+            assert (r.json()["accepted"], r.json()["duplicates"]) == (4, 0)
+            assert len(stored(database_engine, "test_buffer_3")) == 4
+            r = self.client.post("/sense", json=batch)
+            assert (r.json()["accepted"], r.json()["duplicates"]) == (0, 4)
+        finally:
+            main.app.state.ingest_buffer = None
+            buffer.stop()
+
+    def test_flush_errors(self, database_engine):
+        """ A failed write fails only its own requests and the buffer keeps flushing """
+        def on_commit(rows):
+            raise RuntimeError("on_commit failed")
+
+        buffer = IngestBuffer(database_engine, flush_ms=10, on_commit=on_commit)
+        buffer.start()
+        try:
+            write = buffer._write
+            buffer._write = lambda batches: (_ for _ in ()).throw(OSError("write lock"))
+            with pytest.raises(OSError):
+                buffer.submit(payloads(2)).result(5)
+            buffer._write = write
+            assert len(buffer.submit(payloads(2)).result(5)) == 2
+            assert len(buffer.submit(payloads(2, start=int(time.time()) + 10)).result(5)) == 2
+        finally:
+            buffer.stop()
+        assert buffer.stats()["failed"] == 2
+        assert len(stored(database_engine)) == 4
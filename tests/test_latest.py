@@ -0,0 +1,51 @@
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+from pathlib import Path
+import sys
+import time
+
+# Add the project root directory to the sys path
+sys.path.append(str(Path(__file__).absolute().parents[1]))
+
+import main
+from latest import LatestReadings
+from sensor_reading import SensorReading, SensorReadingPayload
+
+
+def reading(sensor, value, recorded):
+    return {"sensor": sensor, "unit": "C", "value": value, "recorded_timestamp": recorded}
+
+
+class TestLatest:
+
+    client = TestClient(main.app)
+
+    def test_latest_follows_sense(self, database_engine):
+        now = int(time.time())
+        assert self.client.post("/sense", json=[reading("l_a", 1.0, now - 10), reading("l_b", 2.0, now)]).status_code == 200
+
+        r = self.client.get("/latest")
+        assert r.status_code == 200
+        assert [(x["sensor"], x["value"]) for x in r.json()["readings"]] == [("l_a", 1.0), ("l_b", 2.0)]
+        etag = r.headers["ETag"]
+
+        r = self.client.get("/latest", headers={"If-None-Match": etag})
+        assert r.status_code == 304
+
+        # a replayed older reading doesn't replace the newest one
+        self.client.post("/sense", json=[reading("l_a", 5.0, now - 100)])
+        assert self.client.get("/latest", headers={"If-None-Match": etag}).status_code == 304
+
+        self.client.post("/sense", json=[reading("l_a", 3.0, now)])
+        r = self.client.get("/latest", headers={"If-None-Match": etag})
+        assert r.status_code == 200
+        assert r.json()["readings"][0]["value"] == 3.0
+        assert r.headers["ETag"] != etag
+
+    def test_warm_from_database(self, database_engine):
+        with Session(database_engine) as session:
+            SensorReading.ingest(session, [SensorReadingPayload(**reading("w", float(i), 1000 + i)) for i in range(50)])
+            session.commit()
+        latest = LatestReadings(database_engine)
+        assert latest.readings()["w"]["value"] == 49.0
+        assert latest.readings()["w"]["recorded_timestamp"] == 1049
@@ -0,0 +1,32 @@
+from pathlib import Path
+import asyncio
+import sys
+
+import pytest
+
+# Add the project root directory to the sys path
+sys.path.append(str(Path(__file__).absolute().parents[1]))
+
+import loadgen
+import mtool
+
+
+class TestLoadgen:
+
+    def test_parse_mix(self):
+        assert loadgen.parse_mix("read=3,latest") == {"read": 3.0, "latest": 1.0}
+        with pytest.raises(ValueError):
+            loadgen.parse_mix("write=1")
+
+    def test_in_process(self):
+        """ A short run with a backlog replay, which sends its first batch twice """
+        profile = loadgen.LoadProfile(probes=2, sensors=2, batch=5, interval=0.05, backlog=20,
+                                      readers=1, read_interval=0.05, duration=1)
+        results = asyncio.run(mtool.bench_in_process(profile))
+        summary = results["results"]
+        assert summary["sense_backlog"]["requests"] == 2 * 5
+        assert summary["sense"]["requests"] > 0
+        assert all(r["errors"] == 0 for r in summary.values() if isinstance(r, dict))
+        assert summary["readings"] == 5 * (summary["sense"]["requests"] + summary["sense_backlog"]["requests"])
+        kinds = [kind for kind, r in summary.items() if isinstance(r, dict)]
+        assert [line.split()[0] for line in loadgen.compare(results, results)] == kinds
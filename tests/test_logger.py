@@ -0,0 +1,71 @@
+import logging
+from pathlib import Path
+import sys
+
+# Add the project root directory to the sys path
+sys.path.append(str(Path(__file__).absolute().parents[1]))
+
+import logger
+
+
+class Capture(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class Expensive:
+    """ Counts how often it's formatted """
+    formatted = 0
+
+    def __repr__(self):
+        Expensive.formatted += 1
+        return "Expensive()"
+
+
+class TestRequestLogger:
+
+    def capture(self):
+        handler = Capture()
+        logging.getLogger(logger.LOGGER_NAME).addHandler(handler)
+        return handler
+
+    def release(self, handler):
+        logging.getLogger(logger.LOGGER_NAME).removeHandler(handler)
+
+    def test_correlator_from_context(self):
+        handler = self.capture()
+        token = logger.correlator_var.set("111_222_333_444")
+        try:
+            logger.RequestLogger().info("hello %s", "world")
+            logger.RequestLogger("explicit").info("hello")
+        finally:
+            logger.correlator_var.reset(token)
+            self.release(handler)
+        assert [r.correlator for r in handler.records] == ["111_222_333_444", "explicit"]
+        assert handler.records[0].getMessage() == "hello world"
+        assert handler.records[0].funcName == "test_correlator_from_context"
+
+    def test_debug_not_formatted_when_disabled(self):
+        log = logging.getLogger(logger.LOGGER_NAME)
+        request_logger = logger.RequestLogger()
+        level = log.level
+        log.setLevel(logging.INFO)
+        try:
+            Expensive.formatted = 0
+            request_logger.debug("value=%r", Expensive())
+            assert Expensive.formatted == 0
+            assert not request_logger.is_debug()
+        finally:
+            log.setLevel(level)
+
+    def test_handlers_configured_once(self):
+        log = logging.getLogger(logger.LOGGER_NAME)
+        logger.RequestLogger()
+        handlers = list(log.handlers)
+        for _ in range(10):
+            logger.RequestLogger()
+        assert log.handlers == handlers
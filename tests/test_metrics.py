@@ -0,0 +1,84 @@
+from fastapi.testclient import TestClient
+from pathlib import Path
+import sys
+import threading
+import time
+
+# Add the project root directory to the sys path
+sys.path.append(str(Path(__file__).absolute().parents[1]))
+
+import main
+import metrics
+
+
+def reading(sensor, value, recorded):
+    return {"sensor": sensor, "unit": "C", "value": value, "recorded_timestamp": recorded}
+
+
+def samples(text):
+    """ {"name{labels}": value} of the exposition text """
+    result = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            series, value = line.rsplit(" ", 1)
+            result[series] = float(value)
+    return result
+
+
+class TestMetrics:
+
+    client = TestClient(main.app)
+
+    def test_shards_are_added_up(self):
+        metrics.reset()
+
+        def work():
+            for _ in range(1000):
+                metrics.inc(metrics.DUPLICATES)
+                metrics.observe(metrics.BATCH_SIZE, 3)
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        metrics.observe(metrics.BATCH_SIZE, 100000)
+
+        s = samples(metrics.render())
+        assert s["tmonitor_readings_duplicate_total"] == 4000
+        assert s['tmonitor_ingest_batch_size_bucket{le="2"}'] == 0
+        assert s['tmonitor_ingest_batch_size_bucket{le="5"}'] == 4000
+        assert s['tmonitor_ingest_batch_size_bucket{le="50000"}'] == 4000
+        assert s['tmonitor_ingest_batch_size_bucket{le="+Inf"}'] == 4001
+        assert s["tmonitor_ingest_batch_size_count"] == 4001
+        assert s["tmonitor_ingest_batch_size_sum"] == 112000
+
+    def test_label_values_are_escaped(self):
+        metrics.reset()
+        metrics.inc(metrics.INGESTED, ('a "quoted"\\sensor\n',))
+        assert 'tmonitor_readings_ingested_total{sensor="a \\"quoted\\"\\\\sensor\\n"} 1\n' in metrics.render()
+
+    def test_metrics_endpoint(self, database_engine):
+        metrics.reset()
+        now = int(time.time())
+        batch = [reading("m_a", 1.0, now - 30), reading("m_a", 2.0, now - 20), reading("m_b", 3.0, now - 10)]
+        assert self.client.post("/sense", json=batch).status_code == 200
+        assert self.client.post("/sense", json=batch[:1]).json()["duplicates"] == 1
+        assert self.client.get("/read", params={"period": 600}).status_code == 200
+        assert self.client.get("/no/such/thing").status_code == 404
+
+        r = self.client.get("/metrics")
+        assert r.status_code == 200
+        assert r.headers["content-type"] == metrics.CONTENT_TYPE
+        assert "# TYPE tmonitor_http_request_seconds histogram" in r.text
+        s = samples(r.text)
+        assert s['tmonitor_http_requests_total{route="/sense",method="POST",status="200"}'] == 2
+        assert s['tmonitor_http_requests_total{route="unmatched",method="GET",status="404"}'] == 1
+        assert s['tmonitor_http_request_seconds_count{route="/read",method="GET"}'] == 1
+        assert s['tmonitor_readings_ingested_total{sensor="m_a"}'] == 2
+        assert s['tmonitor_readings_ingested_total{sensor="m_b"}'] == 1
+        assert s["tmonitor_readings_duplicate_total"] == 1
+        assert s["tmonitor_ingest_batch_size_count"] == 2
+        assert s["tmonitor_db_commit_seconds_count"] == 2
+        assert s['tmonitor_query_rows_sum{query="fetch_readings"}'] == 3
+        assert 19 <= s['tmonitor_newest_reading_age_seconds{sensor="m_a"}'] < 60
@@ -0,0 +1,139 @@
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+from sqlalchemy import text
+from pathlib import Path
+import sys
+import time
+
+# Add the project root directory to the sys path
+sys.path.append(str(Path(__file__).absolute().parents[1]))
+
+import main
+import database
+from sensor_reading import (
+    SensorReading,
+    SensorReadingPayload,
+    HourlyRollup,
+    partition_name,
+    partition_names,
+    partition_range,
+)
+
+# 2023-11-30T22:00:00Z, two hours before a new month
+MONTH_END = 1_701_381_600
+
+
+def payloads(sensor, start, count, step=600):
+    return [
+        SensorReadingPayload(sensor=sensor, unit="C", value=float(i), recorded_timestamp=start + i * step)
+        for i in range(count)
+    ]
+
+
+def query_plan(engine, statement):
+    sql = statement.compile(engine, compile_kwargs={"literal_binds": True})
+    with engine.connect() as connection:
+        return [row[-1] for row in connection.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+
+
+class TestPartitions:
+
+    client = TestClient(main.app)
+
+    def test_partition_names(self):
+        assert partition_name(MONTH_END) == "sensorreading_202311"
+        assert partition_name(MONTH_END + 7200) == "sensorreading_202312"
+        start, end = partition_range("sensorreading_202312")
+        assert (start, end) == (MONTH_END + 7200, MONTH_END + 7200 + 31 * 86400)
+
+    def test_empty_database(self, database_engine):
+        """ With no readings at all there's still a table to query """
+        r = self.client.get("/read", params={"start_timestamp": 1000, "period": 600})
+        assert r.status_code == 200
+        assert r.json()["readings"] == []
+        r = self.client.get("/aggregate", params={"start_timestamp": 1000, "period": 86400, "bucket": "1h"})
+        assert r.json()["aggregates"] == []
+        database.rebuild_rollups(database_engine)
+
+    def test_ingest_routes_by_month(self, database_engine):
+        received = int(time.time())
+        with Session(database_engine) as session:
+            inserted = SensorReading.ingest(session, payloads("p", MONTH_END, 24), received)
+            session.commit()
+            assert len(inserted) == 24
+            assert partition_names(session) == ["sensorreading_202311", "sensorreading_202312"]
+            # A replay across the boundary is all duplicates
+            assert SensorReading.ingest(session, payloads("p", MONTH_END, 24), received) == []
+
+            readings = SensorReading.fetch_readings(session, start_timestamp=received - 1, period=10, limit=100)
+            assert [r.recorded_timestamp for r in readings] == [MONTH_END + i * 600 for i in range(24)]
+
+            aggregates = SensorReading.fetch_aggregates(session, MONTH_END, 4 * 3600, 3600)
+            assert [(a["bucket_start"], a["count"]) for a in aggregates] == [
+                (MONTH_END + h * 3600, 6) for h in range(4)
+            ]
+            assert SensorReading.fetch_latest(session, "p").recorded_timestamp == MONTH_END + 23 * 600
+
+    def test_read_merges_partitions(self, database_engine):
+        """ Reading several partitions in order is a merge of index seeks, not a sort """
+        with Session(database_engine) as session:
+            SensorReading.ingest(session, payloads("m", MONTH_END - 40 * 86400, 3, step=40 * 86400))
+            session.commit()
+            tables = SensorReading.partitions(session)
+        assert len(tables) == 3
+
+        statement = SensorReading.select_readings(start_timestamp=1000, period=600, sensors=["m"],
+                                                  after=(1200, "m", 1100), tables=tables)
+        plan = query_plan(database_engine, statement)
+        print(plan)
+        assert "MERGE (UNION ALL)" in plan
+        for step in plan:
+            assert "TEMP B-TREE" not in step
+        for t in tables:
+            assert any(f"ix_{t.name}_received" in step for step in plan)
+
+    def test_unpartitioned_readings(self, database_engine):
+        """
+        Readings from before partitioning are read alongside the partitions
+        and database.py moves them into the right ones.
+        """
+        with Session(database_engine) as session:
+            session.add(SensorReading(sensor="u", unit="C", value=1.0,
+                                      recorded_timestamp=MONTH_END, received_timestamp=MONTH_END))
+            session.commit()
+            SensorReading.ingest(session, payloads("u", MONTH_END + 60, 2), MONTH_END + 60)
+            session.commit()
+            # A replay of the unpartitioned reading isn't stored again
+            assert SensorReading.ingest(session, payloads("u", MONTH_END, 2, step=60), MONTH_END + 120) == []
+            session.commit()
+
+            # One bucket has readings from both tables
+            aggregates = SensorReading.fetch_aggregates(session, MONTH_END, 3600, 300)
+            assert [(a["count"], a["mean"]) for a in aggregates] == [(2, 0.5), (1, 1.0)]
+            assert len(SensorReading.fetch_readings(session, start_timestamp=MONTH_END - 1, period=100)) == 3
+
+        assert database.partition_readings(database_engine) == 1
+        with Session(database_engine) as session:
+            tables = SensorReading.partitions(session)
+            assert [t.name for t in tables] == ["sensorreading_202311"]
+            assert len(session.execute(select(tables[0])).all()) == 3
+
+    def test_expire(self, database_engine):
+        """ Expired months are dropped whole and their rollups are kept """
+        now = int(time.time())
+        with Session(database_engine) as session:
+            SensorReading.ingest(session, payloads("e", MONTH_END, 24))
+            SensorReading.ingest(session, payloads("e", now - 3600, 2))
+            session.commit()
+
+        maintenance = database.Maintenance(database_engine, retention_days=90)
+        assert maintenance.expire() == ["sensorreading_202311", "sensorreading_202312"]
+        assert database.Maintenance(database_engine).expire() == []
+        with Session(database_engine) as session:
+            assert partition_names(session) == [partition_name(now - 3600)]
+            hours = session.exec(select(HourlyRollup).where(HourlyRollup.bucket_start < now - 86400)).all()
+            assert sum(h.count for h in hours) == 24
+
+        r = self.client.get("/aggregate", params={"start_timestamp": MONTH_END, "period": 4 * 3600,
+                                                  "bucket": "1h", "sensor": "e"})
+        assert [a["count"] for a in r.json()["aggregates"]] == [6, 6, 6, 6]
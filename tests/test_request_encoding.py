@@ -0,0 +1,45 @@
+from fastapi.testclient import TestClient
+from pathlib import Path
+import gzip
+import json
+import sys
+import time
+
+# Add the project root directory to the sys path
+sys.path.append(str(Path(__file__).absolute().parents[1]))
+
+import main
+import request_encoding
+
+GZIP_JSON = {"Content-Type": "application/json", "Content-Encoding": "gzip"}
+
+
+class TestRequestEncoding:
+
+    client = TestClient(main.app)
+
+    def test_gzipped_sense(self, database_engine):
+        now = int(time.time())
+        readings = [
+            {"sensor": "gz", "unit": "C", "value": float(i), "recorded_timestamp": now - 100 + i} for i in range(100)
+        ]
+        body = gzip.compress(json.dumps(readings).encode("utf-8"))
+        r = self.client.post("/sense", content=body, headers=GZIP_JSON)
+        assert r.status_code == 200
+        assert r.json()["accepted"] == 100
+
+        r = self.client.post("/sense", content=body, headers=GZIP_JSON)
+        assert r.json()["duplicates"] == 100
+
+    def test_bad_gzip(self, database_engine):
+        r = self.client.post("/sense", content=b"not gzip", headers=GZIP_JSON)
+        assert r.status_code == 400
+
+        truncated = gzip.compress(b"[]" * 1000)[:-10]
+        r = self.client.post("/sense", content=truncated, headers=GZIP_JSON)
+        assert r.status_code == 400
+
+    def test_too_big(self, database_engine):
+        body = gzip.compress(b" " * (request_encoding.MAX_SIZE + 1) + b"[]")
+        r = self.client.post("/sense", content=body, headers=GZIP_JSON)
+        assert r.status_code == 413
@@ -0,0 +1,79 @@
+from fastapi.testclient import TestClient
+from pathlib import Path
+import sys
+import time
+
+# Add the project root directory to the sys path
+sys.path.append(str(Path(__file__).absolute().parents[1]))
+
+import main
+from response_cache import ResponseCache, RECEIVED, RECORDED
+
+
+class TestResponseCache:
+
+    client = TestClient(main.app)
+
+    def test_lru_bound(self):
+        cache = ResponseCache(None, max_bytes=400)
+        for i in range(10):
+            cache.put(("k", i), b"x" * 100, "application/json", RECEIVED, 0, 10, cache.generation)
+        stats = cache.stats()
+        assert stats["bytes"] <= 400
+        assert cache.get(("k", 0)) is None
+        assert cache.get(("k", 9)) is not None
+        assert stats["evicted"] == 6
+
+    def test_invalidate_overlapping_only(self):
+        cache = ResponseCache(None)
+        cache.put("early", b"a", "application/json", RECEIVED, 100, 200, 0)
+        cache.put("late", b"b", "application/json", RECEIVED, 300, 400, 0)
+        cache.put("recorded", b"c", "application/json", RECORDED, 100, 200, 0)
+        cache.invalidate(received=(350, 360), recorded=(150, 150))
+        assert cache.get("early") is not None
+        assert cache.get("late") is None
+        assert cache.get("recorded") is None
+
+    def test_stale_put_ignored(self):
+        """ A response computed before a commit mustn't be cached after it """
+        cache = ResponseCache(None)
+        generation = cache.generation
+        cache.invalidate(received=(0, 0), recorded=(0, 0))
+        cache.put("k", b"a", "application/json", RECEIVED, 0, 10, generation)
+        assert cache.get("k") is None
+
+    def test_read_cached_until_new_readings(self, database_engine):
+        now = int(time.time())
+        batch = [{"sensor": "cache", "unit": "C", "value": 1.0, "recorded_timestamp": now - 5000}]
+        assert self.client.post("/sense", json=batch).status_code == 200
+
+        past = {"start_timestamp": now - 7200, "period": 3600}
+        first = self.client.get("/read", params=past)
+        second = self.client.get("/read", params=dict(reversed(list(past.items()))))
+        assert (first.headers["X-Cache"], second.headers["X-Cache"]) == ("miss", "hit")
+        assert second.content == first.content
+        assert "immutable" in second.headers["Cache-Control"]
+
+        current = {"start_timestamp": now - 60, "period": 3600}
+        assert len(self.client.get("/read", params=current).json()["readings"]) == 1
+        assert self.client.get("/read", params=current).headers["X-Cache"] == "hit"
+        assert self.client.get("/read", params=current).headers["Cache-Control"] == "no-cache"
+
+        aggregate = {"start_timestamp": now - 7200, "period": 7200, "bucket": "1h"}
+        assert self.client.get("/aggregate", params=aggregate).json()["aggregates"][0]["count"] == 1
+
+        batch = [{"sensor": "cache", "unit": "C", "value": 2.0, "recorded_timestamp": now - 4000}]
+        assert self.client.post("/sense", json=batch).status_code == 200
+
+        # the old received window can't have changed, the others have
+        assert self.client.get("/read", params=past).headers["X-Cache"] == "hit"
+        r = self.client.get("/read", params=current)
+        assert r.headers["X-Cache"] == "miss"
+        assert len(r.json()["readings"]) == 2
+        r = self.client.get("/aggregate", params=aggregate)
+        assert r.headers["X-Cache"] == "miss"
+        assert sum(a["count"] for a in r.json()["aggregates"]) == 2
+
+        stats = self.client.get("/stats").json()["response_cache"]
+        assert stats["hits"] == 4
+        assert stats["invalidated"] == 2
@@ -0,0 +1,65 @@
+from pathlib import Path
+import asyncio
+import sys
+import time
+
+# Add the linux probe's directory to the sys path
+sys.path.append(str(Path(__file__).absolute().parents[1] / "linux"))
+
+from devicereader import DeviceReader
+import scheduler
+
+
+class FakeReader(DeviceReader):
+    def __init__(self, name, delay=0.0, interval=None, timeout=None):
+        self.name = name
+        self.delay = delay
+        self.interval = interval
+        self.timeout = timeout
+        self.started = []
+
+    async def read(self):
+        self.started.append(time.time())
+        await asyncio.to_thread(time.sleep, self.delay)
+        return [{"sensor": self.name, "unit": "C", "value": 1.0, "recorded_timestamp": int(time.time())}]
+
+
+def run_for(seconds, readers, on_readings, interval=0.1, timeout=1.0):
+    async def run():
+        try:
+            await asyncio.wait_for(scheduler.run_readers(readers, on_readings, interval, timeout), seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    asyncio.run(run())
+
+
+class TestScheduler:
+
+    def test_next_time(self):
+        assert scheduler.next_time(1000.0, 300, 2.5) == 1202.5
+        assert scheduler.next_time(1202.5, 300, 2.5) == 1502.5
+        assert scheduler.next_time(1202.4, 300, 2.5) == 1202.5
+
+    def test_slow_reader_doesnt_delay_others(self):
+        fast = FakeReader("fast")
+        slow = FakeReader("slow", delay=0.35, timeout=0.05)
+        received = []
+        run_for(0.55, [fast, slow], received.extend)
+
+        # the fast reader kept to its interval while the slow one was busy
+        assert len(fast.started) >= 5
+        # the slow reader timed out, skipped slots until its read finished
+        # and its late readings were still kept
+        assert 2 <= len(slow.started) <= 3
+        assert [r["sensor"] for r in received].count("slow") >= 1
+
+    def test_no_drift(self):
+        reader = FakeReader("steady", delay=0.03)
+        run_for(0.65, [reader], lambda readings: None)
+
+        # Reads after the first are on the same offset from multiples of
+        # the interval however long each read took
+        phases = [t % 0.1 for t in reader.started[1:]]
+        assert len(phases) >= 5
+        assert max(phases) - min(phases) < 0.02
@@ -1,18 +1,21 @@
 from fastapi import Request, HTTPException
 from fastapi.routing import APIRoute
 from sqlmodel import Session, select
+from sqlalchemy import inspect, text
 from fastapi.testclient import TestClient
 import pytest
 from pathlib import Path
 import sys
 import time
 import random
+import json
 
 # Add the project root directory to the sys path
 sys.path.append(str(Path(__file__).absolute().parents[1]))
 
 import main
-from sensor_reading import SensorReading
+import database
+from sensor_reading import SensorReading, SensorReadingPayload, HourlyRollup, DailyRollup, ROLLUPS
 
 @pytest.fixture
 def ten_readings(database_engine):
@@ -36,6 +39,13 @@ def ten_readings(database_engine):
 
 
 
+def query_plan(engine, statement):
+    """ The details column of EXPLAIN QUERY PLAN for a statement """
+    sql = statement.compile(engine, compile_kwargs={"literal_binds": True})
+    with engine.connect() as connection:
+        return [row[-1] for row in connection.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+
+
 class TestSensorReading:
 
     client = TestClient(main.app)
@@ -81,3 +91,231 @@ class TestSensorReading:
                 )
             ).all()
             assert len(result) == 1
+
+    def test_sense_duplicates(self, database_engine):
+        """
+        A replayed backlog should only store the new readings and
+        report the rest as duplicates rather than failing the batch.
+        """
+        timestamp = int(time.time())
+        batch = [
+            {"sensor": "test_sense", "unit": "C", "value": 20.0 + i, "recorded_timestamp": timestamp + i}
+            for i in range(5)
+        ]
+        r = self.client.post("/sense", json=batch[:3])
+        assert r.status_code == 200
+        assert r.json()["accepted"] == 3
+        assert r.json()["duplicates"] == 0
+
+        r = self.client.post("/sense", json=batch)
+        assert r.status_code == 200
+        assert r.json()["accepted"] == 2
+        assert r.json()["duplicates"] == 3
+
+        with Session(database_engine) as read_session:
+            stored = [
+                row
+                for t in SensorReading.partitions(read_session)
+                for row in read_session.execute(select(t).where(t.c.sensor == "test_sense"))
+            ]
+            assert len(stored) == 5
+            assert len(set(r.received_timestamp for r in stored)) <= 2
+
+    @pytest.mark.parametrize("recorded", [None, -1, 10**13])
+    def test_sense_bad_timestamp(self, database_engine, recorded):
+        """ A reading that can't be put in a partition is invalid, not a server error """
+        reading = {"sensor": "test_bad", "unit": "C", "value": 1.0}
+        if recorded is not None:
+            reading["recorded_timestamp"] = recorded
+        r = self.client.post("/sense", json=[reading])
+        assert r.status_code == 422
+
+    @pytest.mark.parametrize("filters", [
+        {},
+        {"sensors": ["a", "b"], "units": ["C"]},
+        {"after": (1200, "a", 1100)},
+        {"sensors": ["a"], "after": (1200, "a", 1100)},
+    ])
+    def test_read_uses_index(self, database_engine, filters):
+        """ /read must not scan the whole table or sort the window """
+        statement = SensorReading.select_readings(start_timestamp=1000, period=600, **filters)
+        plan = query_plan(database_engine, statement)
+        print(plan)
+        for step in plan:
+            assert not (step.startswith("SCAN") and "INDEX" not in step)
+            assert "TEMP B-TREE" not in step
+        assert any("ix_sensorreading_received" in step for step in plan)
+        if "after" in filters:
+            assert any("(received_timestamp,sensor,recorded_timestamp)>" in step for step in plan)
+
+    def test_read_pages(self, database_engine):
+        """
+        Following next_cursor visits every matching reading exactly once
+        even when a whole backlog shares one received_timestamp.
+        """
+        timestamp = int(time.time())
+        for sensor, unit in [("page_a", "C"), ("page_b", "C"), ("page_c", "%")]:
+            batch = [
+                {"sensor": sensor, "unit": unit, "value": float(i), "recorded_timestamp": timestamp - 1000 + i}
+                for i in range(25)
+            ]
+            assert self.client.post("/sense", json=batch).status_code == 200
+
+        seen = []
+        params = {"start_timestamp": timestamp - 60, "period": 120, "limit": 10, "unit": "C"}
+        while True:
+            r = self.client.get("/read", params=params)
+            assert r.status_code == 200
+            page = r.json()
+            assert len(page["readings"]) <= 10
+            seen.extend((x["sensor"], x["recorded_timestamp"]) for x in page["readings"])
+            if page["next_cursor"] is None:
+                break
+            params["cursor"] = page["next_cursor"]
+
+        assert len(seen) == 50
+        assert len(set(seen)) == 50
+        assert set(s for s, _ in seen) == {"page_a", "page_b"}
+
+        r = self.client.get("/read", params={"start_timestamp": timestamp - 60, "period": 120,
+                                             "sensor": ["page_b", "page_c"], "limit": 100})
+        assert len(r.json()["readings"]) == 50
+        assert r.json()["next_cursor"] is None
+
+    def test_read_bad_cursor(self, database_engine):
+        r = self.client.get("/read", params={"cursor": "not-a-cursor"})
+        assert r.status_code == 400
+
+    def test_migrate_adds_indexes(self, database_engine):
+        """ An old database without the newer indexes gets them from migrate() """
+        with database_engine.begin() as connection:
+            connection.execute(text("DROP INDEX ix_sensorreading_received"))
+        names = [i["name"] for i in inspect(database_engine).get_indexes("sensorreading")]
+        assert "ix_sensorreading_received" not in names
+
+        database.migrate(database_engine)
+        names = [i["name"] for i in inspect(database_engine).get_indexes("sensorreading")]
+        assert "ix_sensorreading_received" in names
+
+    def test_aggregate(self, database_engine):
+        """ Buckets are min/max/mean/count of recorded time slots per sensor """
+        start = 1_700_000_100 // 3600 * 3600
+        batch = [
+            {"sensor": "agg_" + s, "unit": "C", "value": float(i), "recorded_timestamp": start + i * 60}
+            for s in "ab"
+            for i in range(120)
+        ]
+        assert self.client.post("/sense", json=batch).status_code == 200
+
+        r = self.client.get("/aggregate", params={"start_timestamp": start, "period": 7200,
+                                                  "bucket": "1h", "sensor": "agg_a"})
+        assert r.status_code == 200
+        assert r.json()["bucket"] == 3600
+        aggregates = r.json()["aggregates"]
+        assert [a["bucket_start"] for a in aggregates] == [start, start + 3600]
+        first = aggregates[0]
+        assert (first["sensor"], first["min"], first["max"], first["count"]) == ("agg_a", 0.0, 59.0, 60)
+        assert first["mean"] == pytest.approx(29.5)
+
+        r = self.client.get("/aggregate", params={"start_timestamp": start, "period": 3600, "bucket": "5m"})
+        assert len(r.json()["aggregates"]) == 2 * 12
+
+        r = self.client.get("/aggregate", params={"bucket": "2m"})
+        assert r.status_code == 422
+
+    @pytest.mark.parametrize("sensors", [None, ["a"]])
+    def test_aggregate_uses_index(self, database_engine, sensors):
+        statement = SensorReading.select_aggregates(1000, 2000, 300, sensors=sensors)
+        plan = query_plan(database_engine, statement)
+        print(plan)
+        for step in plan:
+            assert not (step.startswith("SCAN") and "INDEX" not in step)
+
+    def test_rollups_match_raw(self, database_engine):
+        """
+        Rollups kept up to date on ingest agree with a rebuild and
+        with aggregating the raw readings directly.
+        """
+        start = 1_700_000_000 // 86400 * 86400
+        with Session(database_engine) as session:
+            for batch in range(3):
+                payloads = [
+                    SensorReadingPayload(sensor=f"rollup_{i % 2}", unit="C",
+                                         value=float((i * 7) % 23), recorded_timestamp=start + i * 600)
+                    for i in range(batch * 300, batch * 300 + 400)
+                ]
+                SensorReading.ingest(session, payloads)
+            session.commit()
+
+            tables = [HourlyRollup.__table__, DailyRollup.__table__]
+            incremental = [sorted(session.execute(select(t)).all()) for t in tables]
+            database.rebuild_rollups(database_engine)
+            rebuilt = [sorted(session.execute(select(t)).all()) for t in tables]
+            assert len(incremental[0]) > len(incremental[1]) > 0
+            assert incremental == rebuilt
+
+            # A period that doesn't line up with the buckets at either end
+            for bucket in ROLLUPS:
+                begin, period = start + 1234, 5 * 86400 + 777
+                mixed = SensorReading.fetch_aggregates(session, begin, period, bucket)
+                statement = SensorReading.select_aggregates(begin, begin + period, bucket,
+                                                            tables=SensorReading.partitions(session))
+                direct = [row._asdict() for row in session.execute(statement)]
+                assert len(mixed) == len(direct)
+                for m, d in zip(mixed, direct):
+                    assert m == pytest.approx(d)
+
+    def test_make_database_builds_rollups(self, tmp_path):
+        """ Upgrading a database from before rollups existed fills them in """
+        url = f"sqlite:///{tmp_path / 'old.db'}"
+        engine = database.create_engine(url)
+        SensorReading.__table__.create(engine)
+        with Session(engine) as session:
+            session.add(SensorReading(sensor="old", unit="C", value=3.0,
+                                      recorded_timestamp=7200, received_timestamp=7201))
+            session.commit()
+
+        database.make_database(url)
+        with Session(engine) as session:
+            rollup = session.exec(select(HourlyRollup)).one()
+            assert (rollup.sensor, rollup.bucket_start, rollup.count) == ("old", 7200, 1)
+
+    def test_read_max_points(self, database_engine):
+        """ max_points returns the whole window downsampled per sensor """
+        timestamp = int(time.time())
+        for sensor in ["ds_a", "ds_b"]:
+            batch = [
+                {"sensor": sensor, "unit": "C", "value": float(i % 37), "recorded_timestamp": timestamp - 5000 + i}
+                for i in range(2000)
+            ]
+            assert self.client.post("/sense", json=batch).status_code == 200
+
+        r = self.client.get("/read", params={"start_timestamp": timestamp - 60, "period": 120, "max_points": 50})
+        assert r.status_code == 200
+        readings = r.json()["readings"]
+        for sensor in ["ds_a", "ds_b"]:
+            values = [x["value"] for x in readings if x["sensor"] == sensor]
+            assert 2 <= len(values) <= 50
+            assert (min(values), max(values)) == (0.0, 36.0)
+        assert r.json()["next_cursor"] is None
+
+    def test_read_ndjson(self, database_engine):
+        """ The ndjson export has every reading in the window, one per line """
+        timestamp = int(time.time())
+        batch = [
+            {"sensor": "nd", "unit": "C", "value": i / 10, "recorded_timestamp": timestamp - 3000 + i}
+            for i in range(2500)
+        ]
+        assert self.client.post("/sense", json=batch).status_code == 200
+
+        params = {"start_timestamp": timestamp - 60, "period": 120}
+        for kwargs in [{"params": {**params, "format": "ndjson"}},
+                       {"params": params, "headers": {"Accept": "application/x-ndjson"}}]:
+            r = self.client.get("/read", **kwargs)
+            assert r.status_code == 200
+            assert r.headers["content-type"].startswith("application/x-ndjson")
+            lines = r.text.splitlines()
+            assert len(lines) == 2500
+            first = json.loads(lines[0])
+            assert first["sensor"] == "nd"
+            assert first["recorded_timestamp"] == timestamp - 3000
@@ -0,0 +1,56 @@
+from pathlib import Path
+import asyncio
+import sys
+
+# Add the linux probe's directory to the sys path
+sys.path.append(str(Path(__file__).absolute().parents[1] / "linux"))
+
+from sensorhub import SensorHubReader
+
+
+class FakeBus:
+    """ Stands in for smbus.SMBus and counts I2C transactions """
+
+    def __init__(self, registers: dict):
+        self.registers = registers
+        self.transactions = 0
+
+    def read_byte_data(self, address, register):
+        self.transactions += 1
+        return self.registers.get(register, 0)
+
+    def read_i2c_block_data(self, address, register, length):
+        self.transactions += 1
+        assert length <= 32
+        return [self.registers.get(r, 0) for r in range(register, register + length)]
+
+
+REGISTERS = {
+    0x02: 0x34, 0x03: 0x12,  # light
+    0x05: 21,  # temperature
+    0x06: 55,  # humidity
+    0x09: 0x56, 0x0A: 0x34, 0x0B: 0x01,  # pressure
+    0x0D: 1,  # human presence
+}
+
+
+class TestSensorHub:
+
+    def test_decode(self):
+        bus = FakeBus(REGISTERS)
+        readings = asyncio.run(SensorHubReader(bus).read())
+        assert {r["sensor"]: (r["unit"], r["value"]) for r in readings} == {
+            "temperature": ("C", 21.0),
+            "humidity": ("%", 55.0),
+            "light": ("lux", float(0x1234)),
+            "pressure": ("kPa", float(0x013456)),
+            "human_presence": ("bool", 1.0),
+        }
+        assert len({r["recorded_timestamp"] for r in readings}) == 1
+
+    def test_one_transaction_per_sample(self):
+        bus = FakeBus(REGISTERS)
+        reader = SensorHubReader(bus)
+        for _ in range(10):
+            reader.read_registers()
+        assert bus.transactions / 10 == 1
@@ -0,0 +1,49 @@
+from pathlib import Path
+import sys
+
+# Add the linux probe's directory to the sys path
+sys.path.append(str(Path(__file__).absolute().parents[1] / "linux"))
+
+from spool import Spool
+
+
+def reading(i):
+    return {"sensor": "temperature", "unit": "C", "value": float(i), "recorded_timestamp": 1000 + i}
+
+
+class TestSpool:
+
+    def test_oldest_first_until_removed(self, tmp_path):
+        spool = Spool(str(tmp_path / "spool.db"))
+        assert spool.peek(10) == (None, [])
+        spool.add([reading(i) for i in range(5)])
+        spool.add([reading(5)])
+        assert len(spool) == 6
+
+        last_id, readings = spool.peek(4)
+        assert readings == [reading(i) for i in range(4)]
+        # not sent yet, so they're still there
+        assert spool.peek(4) == (last_id, readings)
+
+        spool.remove(last_id)
+        assert len(spool) == 2
+        assert spool.peek(10)[1] == [reading(4), reading(5)]
+
+    def test_survives_restart(self, tmp_path):
+        path = str(tmp_path / "spool.db")
+        spool = Spool(path)
+        spool.add([reading(i) for i in range(3)])
+        spool.remove(spool.peek(1)[0])
+        spool.close()
+
+        spool = Spool(path)
+        assert len(spool) == 2
+        assert spool.peek(10)[1] == [reading(1), reading(2)]
+
+    def test_oldest_dropped_when_full(self, tmp_path):
+        spool = Spool(str(tmp_path / "spool.db"), max_readings=5)
+        spool.add([reading(i) for i in range(4)])
+        spool.add([reading(i) for i in range(4, 8)])
+        assert len(spool) == 5
+        assert spool.dropped == 3
+        assert spool.peek(10)[1] == [reading(i) for i in range(3, 8)]
@@ -0,0 +1,99 @@
+from pathlib import Path
+import asyncio
+import json
+import sys
+import threading
+import time
+
+# Add the project root directory to the sys path
+sys.path.append(str(Path(__file__).absolute().parents[1]))
+
+import main
+from stream import ReadingBroadcaster, DROPPED
+
+
+def reading(sensor, value=1.0):
+    return {"sensor": sensor, "unit": "C", "value": value, "recorded_timestamp": int(time.time())}
+
+
+class TestReadingBroadcaster:
+
+    def test_filter_and_drop_slow(self):
+        async def scenario():
+            broadcaster = ReadingBroadcaster(queue_size=2)
+            everything = broadcaster.subscribe()
+            only_b = broadcaster.subscribe(["b"])
+
+            # published from another thread, as the ingest path does
+            publisher = threading.Thread(
+                target=lambda: [broadcaster.publish([reading("a", i)]) for i in range(3)]
+            )
+            publisher.start()
+            publisher.join()
+            broadcaster.publish([reading("a"), reading("b")])
+            await asyncio.sleep(0.01)
+
+            assert only_b.queue.qsize() == 1
+            assert [r["sensor"] for r in only_b.queue.get_nowait()] == ["b"]
+
+            # never read, so it overflowed and was dropped
+            assert everything.dropped
+            assert everything.queue.get_nowait() is DROPPED
+            assert broadcaster.subscribers == 1
+            assert broadcaster.dropped == 1
+
+        asyncio.run(scenario())
+
+
+def stream_scope(query_string: bytes):
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/stream",
+        "raw_path": b"/stream",
+        "query_string": query_string,
+        "root_path": "",
+        "headers": [],
+        "client": ("testclient", 50000),
+        "server": ("testserver", 80),
+    }
+
+
+class TestStreamEndpoint:
+    """
+    TestClient waits for the whole response, which never comes for an
+    event stream, so these talk to the ASGI app directly.
+    """
+
+    def test_committed_readings_are_streamed(self, database_engine):
+        async def scenario():
+            sent = asyncio.Queue()
+            disconnected = asyncio.Event()
+
+            async def receive():
+                await disconnected.wait()
+                return {"type": "http.disconnect"}
+
+            app = asyncio.create_task(main.app(stream_scope(b"sensor=s_b"), receive, sent.put))
+            start = await asyncio.wait_for(sent.get(), 5)
+            assert start["status"] == 200
+            assert (b"content-type", b"text/event-stream; charset=utf-8") in start["headers"]
+            assert (await asyncio.wait_for(sent.get(), 5))["body"] == b": connected\n\n"
+
+            now = int(time.time())
+            main.readings_committed(main.app, [("s_a", "C", 1.0, now, now), ("s_b", "C", 7.5, now, now)])
+            body = (await asyncio.wait_for(sent.get(), 5))["body"].decode("utf-8")
+
+            disconnected.set()
+            await asyncio.wait_for(app, 5)
+            return body
+
+        body = asyncio.run(scenario())
+        event, data = body.strip().split("\n")
+        assert event == "event: readings"
+        readings = json.loads(data[len("data: "):])
+        assert [(x["sensor"], x["value"]) for x in readings] == [("s_b", 7.5)]
+        assert main.app.state.broadcaster.subscribers == 0